@@ -104,7 +104,7 @@ with col1:
             <div class="feature-title">🖼️ Symmetry Map From Image</div>
             <div class="feature-tag">Patch-based symmetry visualization</div>
             <p style="margin-top:0.4rem;">
-              Upload an image and compute a dense symmetry map using 3×3 patches.
+              Upload an image and compute a dense symmetry map using 3×3 to 11×11 patches.
               A symmetry threshold slider lets you interactively highlight regions with high structural symmetry,
               and a histogram summarizes the symmetry score distribution.
             </p>
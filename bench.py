@@ -0,0 +1,246 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+import numpy as np
+
+from utils import (
+    compute_symmetry_score, batch_symmetry_scores, recondition_kernel,
+    batch_recondition_kernels, batch_condition_numbers, kernels_to_matrices,
+    parse_csv_matrices, symmetry_map,
+)
+from parallel import parallel_symmetry_map
+
+# Reproducible benchmarks for the core kernel-analysis functions. Inputs are
+# synthetic and seeded, so two runs on the same machine measure the same work.
+#
+#   python bench.py                      # quick grid
+#   python bench.py --full -o new.json   # 10^3..10^7 kernels, 3..11, 256²..4096²
+#   python bench.py --compare old.json new.json
+#   python bench.py --startup            # cold start of every Streamlit page
+#
+# Each result records the best wall time over --repeat runs, throughput in
+# items (kernels or pixels) per second and the peak traced allocation of a
+# separate run.
+
+QUICK = {"counts": [1000, 100000], "sizes": [3, 5], "images": [256, 1024]}
+FULL = {"counts": [10**3, 10**4, 10**5, 10**6, 10**7], "sizes": [3, 5, 7, 9, 11],
+        "images": [256, 512, 1024, 2048, 4096]}
+
+# Per-kernel Python loops are only timed up to this many kernels.
+SCALAR_MAX = 10**4
+# Skip cases whose float64 input would exceed this many bytes.
+MAX_INPUT_BYTES = 2 * 2**30
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Cold-start budget of every Streamlit page: a fresh interpreter running the
+# page script with no input (what a new session or replica pays before the
+# first render). Heavy frameworks must only load when a feature needs them.
+STARTUP_BUDGET = {"seconds": 3.0, "rss_mb": 300}
+STARTUP_FORBIDDEN = ("tensorflow", "keras", "torch", "onnx", "matplotlib")
+
+_STARTUP_PROBE = '''
+import json, resource, runpy, sys
+sys.path.insert(0, sys.argv[1])
+runpy.run_path(sys.argv[2], run_name="__main__")
+try:
+    # Peak RSS of this process image; ru_maxrss would include the forking parent.
+    with open("/proc/self/status") as f:
+        rss_kb = next(int(l.split()[1]) for l in f if l.startswith("VmHWM:"))
+except (OSError, StopIteration):
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"rss_kb": rss_kb, "modules": sorted({m.split(".")[0] for m in sys.modules})}))
+'''
+
+
+def kernels(count, n, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, n, n))
+
+
+def measure(fn, repeat):
+    # Timed runs are untraced (tracemalloc hooks every allocation and would
+    # slow allocation-heavy paths); the peak comes from one extra traced run.
+    best = np.inf
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+
+def cases(grid):
+    for n in grid["sizes"]:
+        for count in grid["counts"]:
+            if count * n * n * 8 > MAX_INPUT_BYTES:
+                continue
+            mats = lambda count=count, n=n: kernels(count, n)
+            if count <= SCALAR_MAX:
+                yield "compute_symmetry_score", n, count, mats, \
+                    lambda m: [compute_symmetry_score(k) for k in m]
+                yield "recondition_kernel", n, count, mats, \
+                    lambda m: [recondition_kernel(k, 5.0) for k in m]
+                yield "np.linalg.cond", n, count, mats, \
+                    lambda m: [np.linalg.cond(k) for k in m]
+            yield "batch_symmetry_scores", n, count, mats, batch_symmetry_scores
+            yield "batch_recondition_kernels", n, count, mats, lambda m: batch_recondition_kernels(m, 5.0)
+            yield "batch_condition_numbers", n, count, mats, batch_condition_numbers
+
+            # kernels_to_matrices on an HWIO tensor holding `count` kernels
+            in_ch = max(1, int(np.sqrt(count)))
+            out_ch = max(1, count // in_ch)
+            yield "kernels_to_matrices", n, in_ch * out_ch, \
+                lambda n=n, i=in_ch, o=out_ch: np.random.default_rng(0).normal(size=(n, n, i, o)).astype(np.float32), \
+                kernels_to_matrices
+
+            if count <= 10**6:
+                def csv_bytes(count=count, n=n):
+                    sio = StringIO()
+                    np.savetxt(sio, kernels(count, n).reshape(count, -1), delimiter=",", fmt="%.8g")
+                    return sio.getvalue().encode("utf-8")
+                yield "parse_csv_matrices", n, count, csv_bytes, parse_csv_matrices
+
+    for side in grid["images"]:
+        for p in (3, 5) if grid is QUICK else grid["sizes"]:
+            img = lambda side=side: np.random.default_rng(0).uniform(0, 255, size=(side, side))
+            yield "symmetry_map", p, side * side, img, lambda a, p=p: symmetry_map(a, p)
+            yield "parallel_symmetry_map", p, side * side, img, lambda a, p=p: parallel_symmetry_map(a, p)
+
+
+def run(grid, repeat, only=None):
+    results = []
+    for name, n, count, make, fn in cases(grid):
+        if only and name not in only:
+            continue
+        data = make()
+        seconds, peak = measure(lambda: fn(data), repeat)
+        del data
+        rec = {
+            "name": name, "n": n, "count": count,
+            "seconds": seconds, "throughput": count / seconds if seconds > 0 else None,
+            "peak_bytes": peak,
+        }
+        results.append(rec)
+        print(f"{name:28s} n={n:<3d} count={count:<10d} {seconds:10.4f}s "
+              f"{rec['throughput']:14.0f}/s  peak {peak / 2**20:9.1f} MiB", flush=True)
+    return results
+
+
+def startup_pages():
+    pages_dir = os.path.join(ROOT, "pages")
+    return [os.path.join(ROOT, "Home.py")] + sorted(
+        os.path.join(pages_dir, f) for f in os.listdir(pages_dir) if f.endswith(".py"))
+
+
+def startup(repeat, budget_seconds, budget_mb):
+    # Returns (results, number of pages over budget).
+    results = []
+    over = 0
+    for page in startup_pages():
+        name = os.path.relpath(page, ROOT)
+        best = np.inf
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, ROOT, page],
+                                  capture_output=True, text=True, cwd=ROOT)
+            best = min(best, time.perf_counter() - t0)
+        if proc.returncode != 0:
+            print(f"{name:50s} FAILED\n{proc.stderr}", flush=True)
+            over += 1
+            continue
+        probe = json.loads(proc.stdout.strip().splitlines()[-1])
+        rss = probe["rss_kb"] * 1024
+        heavy = [m for m in STARTUP_FORBIDDEN if m in probe["modules"]]
+        problems = []
+        if best > budget_seconds:
+            problems.append(f"> {budget_seconds:g}s")
+        if rss > budget_mb * 2**20:
+            problems.append(f"> {budget_mb:g} MiB")
+        if heavy:
+            problems.append("imports " + ", ".join(heavy))
+        over += bool(problems)
+        results.append({"name": f"startup {name}", "n": 0, "count": 1, "seconds": best,
+                        "throughput": None, "peak_bytes": rss, "heavy_modules": heavy})
+        print(f"{name:50s} {best:8.3f}s  rss {rss / 2**20:7.1f} MiB  "
+              f"{'OVER BUDGET: ' + '; '.join(problems) if problems else 'ok'}", flush=True)
+    return results, over
+
+
+def compare(old_path, new_path, tolerance):
+    # Exit status 1 if any matching case got slower by more than tolerance.
+    with open(old_path) as f:
+        old = {(r["name"], r["n"], r["count"]): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    regressions = 0
+    for r in new:
+        key = (r["name"], r["n"], r["count"])
+        if key not in old:
+            continue
+        ratio = r["seconds"] / old[key]["seconds"]
+        mem = r["peak_bytes"] / max(1, old[key]["peak_bytes"])
+        flag = "REGRESSION" if ratio > 1 + tolerance else ""
+        regressions += bool(flag)
+        print(f"{key[0]:28s} n={key[1]:<3d} count={key[2]:<10d} time x{ratio:6.2f}  mem x{mem:6.2f}  {flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="bench.py", description="Benchmark the core kernel-analysis functions.")
+    p.add_argument("--full", action="store_true", help="run the full 10^3..10^7 / 3..11 / 256²..4096² grid")
+    p.add_argument("--repeat", type=int, default=3, help="runs per case; the best time is kept (default: 3)")
+    p.add_argument("--only", nargs="+", help="run only these benchmark names")
+    p.add_argument("-o", "--output", help="write results as JSON to this file")
+    p.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two JSON result files")
+    p.add_argument("--tolerance", type=float, default=0.10,
+                   help="allowed slowdown before --compare reports a regression (default: 0.10)")
+    p.add_argument("--startup", action="store_true",
+                   help="measure the cold start of every Streamlit page against the startup budget; "
+                        "exit status 1 if any page is over it")
+    p.add_argument("--budget-seconds", type=float, default=STARTUP_BUDGET["seconds"])
+    p.add_argument("--budget-mb", type=float, default=STARTUP_BUDGET["rss_mb"])
+    args = p.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.tolerance)
+
+    status = 0
+    if args.startup:
+        results, over = startup(args.repeat, args.budget_seconds, args.budget_mb)
+        status = 1 if over else 0
+    else:
+        results = run(FULL if args.full else QUICK, args.repeat, args.only)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "machine": {
+                    "python": sys.version.split()[0],
+                    "numpy": np.__version__,
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                },
+                "grid": "startup" if args.startup else "full" if args.full else "quick",
+                "repeat": args.repeat,
+                "results": results,
+            }, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
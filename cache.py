@@ -0,0 +1,198 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Content-addressed cache shared by every page and session of the app process.
+# Keys are a hash of the uploaded bytes plus the analysis parameters, values are
+# parsed matrices, score arrays, models, ... Entries live in a size-bounded LRU
+# in memory and, when CONVNET_CACHE_DIR is set, in a bounded on-disk tier that
+# survives restarts.
+
+DEFAULT_MEMORY_BYTES = int(os.environ.get("CONVNET_CACHE_MB", "1024")) * 2**20
+DEFAULT_DISK_BYTES = int(os.environ.get("CONVNET_CACHE_DISK_MB", "8192")) * 2**20
+
+
+def content_key(data, *params, **named):
+    # data is bytes, a memoryview or a file-like upload; params are anything
+    # with a stable repr (C, kernel size, patch size, operation name, ...).
+    h = hashlib.blake2b(digest_size=20)
+    if hasattr(data, "getbuffer"):
+        h.update(data.getbuffer())
+    elif hasattr(data, "read"):
+        data.seek(0)
+        for block in iter(lambda: data.read(1 << 20), b""):
+            h.update(block)
+        data.seek(0)
+    elif data is not None:
+        h.update(memoryview(data).cast("B"))
+    h.update(repr((params, sorted(named.items()))).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _nbytes(obj, _seen=None):
+    # Approximate memory held by a cached value. Objects can report their own
+    # size with an integer nbytes attribute; other objects are sized by their
+    # attributes (the arrays inside StreamingStats, ...). Values neither covers
+    # pass an explicit size to put() / cached().
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    _seen = set() if _seen is None else _seen
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    if isinstance(obj, (tuple, list)):
+        return sum(_nbytes(o, _seen) for o in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(o, _seen) for o in obj.values())
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)):
+        return int(nbytes)
+    if hasattr(obj, "__dict__"):
+        return sys.getsizeof(obj) + sum(_nbytes(o, _seen) for o in vars(obj).values())
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    def __init__(self, max_bytes=DEFAULT_MEMORY_BYTES, disk_dir=None, max_disk_bytes=DEFAULT_DISK_BYTES):
+        self.max_bytes = int(max_bytes)
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = int(max_disk_bytes)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+                os.utime(path)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+            else:
+                self.hits += 1
+                self._put_memory(key, value)
+                return value
+        self.misses += 1
+        return default
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    def _put_memory(self, key, value, size=None):
+        size = _nbytes(value) if size is None else int(size)
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._size -= old_size
+
+    def put(self, key, value, persist=True, size=None):
+        # persist=False keeps unpicklable values memory-only;
+        # size overrides the estimated size in bytes.
+        self._put_memory(key, value, size)
+        if self.disk_dir and persist:
+            path = self._disk_path(key)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+            except (OSError, pickle.PicklingError, TypeError, AttributeError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            else:
+                self._evict_disk()
+        return value
+
+    def _evict_disk(self):
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.disk_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def get_or_compute(self, key, fn, persist=True, size=None):
+        # size: the value's size in bytes, or a function of the value.
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = fn()
+            self.put(key, value, persist=persist, size=size(value) if callable(size) else size)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    # Process-wide cache. Streamlit imports this module once per server
+    # process, so every session shares it.
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = LRUCache(disk_dir=os.environ.get("CONVNET_CACHE_DIR") or None)
+        return _default_cache
+
+
+def cached(key_data, fn, *params, persist=True, size=None, **named):
+    cache = get_cache()
+    return cache.get_or_compute(content_key(key_data, *params, **named), fn, persist=persist, size=size)
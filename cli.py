@@ -0,0 +1,297 @@
+import argparse
+import os
+import shutil
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from utils import (write_kernel_store, kernel_stats, kernels_to_matrices, recondition_h5_layers, resolve_dtype,
+                   KERNEL_STORE_EXT, LAYOUTS, PRECISIONS)
+from weight_sources import open_weight_source, layer_table, MODEL_EXTS
+from parallel import parallel_symmetry_scores, parallel_condition_numbers, parallel_recondition_kernels
+from incremental import LayerStore, layer_fingerprint, diff_summaries
+from dedup import (exact_duplicate_labels, near_duplicate_labels, duplicate_groups,
+                   canonical_orientation, apply_dihedral, INVERSE)
+
+# Headless batch runner: the Streamlit pages' analyses over one model, several
+# models or a directory of models, writing one output folder per model (its
+# path under the input directory).
+#
+#   python cli.py models/ -o results/ --sizes 3 5 --C 5 --export kbin --recondition -j 8
+#
+# With --incremental, checkpoints are processed one at a time in path order,
+# layers whose weights did not change are reused from a fingerprint-keyed store
+# and each checkpoint's folder gets a diff.csv against the previous one.
+#
+# Exit codes (for batch schedulers):
+EXIT_OK = 0
+EXIT_FAILED = 1     # at least one model failed; the others were processed
+EXIT_USAGE = 2      # bad arguments, clashing output folders or no model files found
+
+def _is_saved_model(path):
+    return os.path.isfile(os.path.join(path, "saved_model.pb"))
+
+
+def find_models(paths):
+    # [(model path, name)] for model files with a known extension and
+    # SavedModel directories. name is the model's path relative to the input
+    # it was found under, without extension; it names the output folder.
+    found = []
+    def add(path, rel):
+        found.append((path, os.path.splitext(rel)[0] if os.path.isfile(path) else rel))
+    for p in paths:
+        if os.path.isdir(p) and _is_saved_model(p):
+            add(p, os.path.basename(os.path.normpath(p)))
+        elif os.path.isdir(p):
+            for root, dirs, files in os.walk(p):
+                saved = sorted(d for d in dirs if _is_saved_model(os.path.join(root, d)))
+                dirs[:] = sorted(d for d in dirs if d not in saved)
+                for f in saved + [f for f in sorted(files) if f.lower().endswith(MODEL_EXTS)]:
+                    add(os.path.join(root, f), os.path.relpath(os.path.join(root, f), p))
+        elif os.path.isfile(p):
+            add(p, os.path.basename(p))
+    return found
+
+
+def _safe_name(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+
+
+def _model_out(out_dir, name):
+    # Output folder of a model named by find_models: its relative path, so
+    # step1/model.h5 and step2/model.h5 write to <out>/step1/model and
+    # <out>/step2/model.
+    return os.path.join(out_dir, *(_safe_name(part) for part in name.split(os.sep)))
+
+
+def analyze_layer(mats, C, workers=1, recondition=False, dedup=None, dtype=None):
+    # Returns (stats, arrays) with the per-kernel scores, conds and, with
+    # recondition, rec and cond_after. With dedup="exact" only distinct kernels
+    # are computed, with dedup="orbit" the SVD work (condition numbers and
+    # reconditioning, rotated back per kernel) runs once per dihedral orbit;
+    # results are fanned back out and equal up to float rounding. Symmetry
+    # scores are still computed per kernel: utils.transformations is not the
+    # full group, so the score is not invariant on an orbit.
+    work, inverse = mats, None
+    if dedup == "orbit":
+        canon, which = canonical_orientation(mats)
+        reps, inverse = np.unique(exact_duplicate_labels(canon), return_inverse=True)
+        work = canon[reps].astype(mats.dtype, copy=False)
+    elif dedup:
+        reps, inverse = np.unique(exact_duplicate_labels(mats), return_inverse=True)
+        work = mats[reps]
+    fan = (lambda a: a) if inverse is None else (lambda a: a[inverse.ravel()])
+
+    scores = (parallel_symmetry_scores(mats, workers=workers, dtype=dtype) if dedup == "orbit"
+              else fan(parallel_symmetry_scores(work, workers=workers, dtype=dtype)))
+    conds = fan(parallel_condition_numbers(work, workers=workers, dtype=dtype))
+    stats = kernel_stats(mats, C, scores, conds)
+    if dedup:
+        stats["num_unique"] = int(work.shape[0])
+    arrays = {"scores": scores, "conds": conds}
+    if recondition:
+        rec, _, cond_after, _, _ = parallel_recondition_kernels(work, C, workers=workers, dtype=dtype)
+        rec = fan(rec)
+        if dedup == "orbit":
+            rec = apply_dihedral(rec, INVERSE[which])
+        arrays.update(rec=rec, cond_after=fan(cond_after))
+        stats["cond_max_after"] = float(cond_after.max())
+    return stats, arrays
+
+
+def _analyze_layers(source, model_out, sizes, C, export, recondition, kernel_workers, store,
+                    dedup=None, near_tol=0.0, dihedral=False, precision=None):
+    # Per-layer outputs of one model; returns (summary rows, layers reused from store).
+    # Stored layers are keyed by every setting that changes their results.
+    settings = dict(dedup=dedup, layout=source.layout, dtype=resolve_dtype(precision).name)
+    layers = layer_table(source, sizes)
+    layers.to_csv(os.path.join(model_out, "layers.csv"), index=False)
+
+    summary = []
+    reused = 0
+    for _, row in layers[layers["status"] == "matched"].iterrows():
+        idx, layer_name = int(row["index"]), row["layer_name"]
+        kernel = source.read(layer_name)
+        if kernel is None:
+            continue
+        mats, h, w = kernels_to_matrices(kernel, source.layout)
+        fingerprint = layer_fingerprint(kernel)
+        hit = store.get(fingerprint, C, recondition, **settings) if store else None
+        base = f"layer{idx:03d}_{_safe_name(layer_name)}_{h}x{w}"
+        meta = dict(layer_name=layer_name, in_channels=int(row["in_channels"]),
+                    out_channels=int(row["out_channels"]))
+
+        if export == "csv":
+            np.savetxt(os.path.join(model_out, base + ".csv"),
+                       mats.reshape(mats.shape[0], -1), delimiter=",", fmt="%.8g")
+        elif export == "kbin":
+            write_kernel_store(os.path.join(model_out, base + KERNEL_STORE_EXT), mats, **meta)
+
+        if hit is not None:
+            stats, arrays = hit
+            reused += 1
+        else:
+            stats, arrays = analyze_layer(mats, C, kernel_workers, recondition, dedup, precision)
+            if store:
+                store.put(fingerprint, C, recondition, stats, arrays, **settings)
+
+        if near_tol > 0 or dihedral:
+            groups = duplicate_groups(near_duplicate_labels(mats, near_tol, dihedral))
+            groups.to_csv(os.path.join(model_out, base + "_duplicates.csv"), index=False)
+            stats = {**stats, "near_duplicate_groups": len(groups),
+                     "near_duplicate_kernels": int(groups["size"].sum() - len(groups))}
+
+        pd.DataFrame({"symmetry_score": arrays["scores"], "condition_number": arrays["conds"]}).to_csv(
+            os.path.join(model_out, base + "_scores.csv"), index=False)
+        if recondition:
+            write_kernel_store(os.path.join(model_out, base + "_reconditioned" + KERNEL_STORE_EXT),
+                               arrays["rec"], **meta)
+
+        summary.append({"index": idx, "layer_name": layer_name, "kernel_size": h,
+                        "fingerprint": fingerprint, **stats})
+    return summary, reused
+
+
+def process_model(model_path, model_out, sizes, C, export, recondition, write_back=False,
+                  kernel_workers=1, store_dir=None, layout=None, **dedup):
+    # Runs in a worker process and writes to the model's own folder model_out;
+    # returns (model_path, ok, message). kernel_workers
+    # shards each layer's kernels across processes when models run one at a time.
+    # With store_dir, per-layer results are looked up by kernel fingerprint first.
+    # layout overrides the kernel layout the model's weight source declares;
+    # dedup holds the dedup / near_tol / dihedral / precision options of
+    # _analyze_layers.
+    t0 = time.perf_counter()
+    try:
+        os.makedirs(model_out, exist_ok=True)
+        store = LayerStore(store_dir) if store_dir else None
+
+        with open_weight_source(model_path, layout=layout) as source:
+            if write_back and source.FORMAT != "h5":
+                raise ValueError("--write-back supports Keras .h5 models only")
+            summary, reused = _analyze_layers(source, model_out, sizes, C, export, recondition,
+                                              kernel_workers, store, **dedup)
+        pd.DataFrame(summary).to_csv(os.path.join(model_out, "summary.csv"), index=False)
+
+        if write_back:
+            # Patch a copy of the model; the input file is never modified.
+            patched = os.path.join(model_out, os.path.basename(model_path))
+            shutil.copyfile(model_path, patched)
+            matched = [row["layer_name"] for row in summary]
+            recondition_h5_layers(patched, C, layers=matched).to_csv(
+                os.path.join(model_out, "write_back.csv"), index=False)
+
+        msg = f"{len(summary)} layers"
+        if store:
+            msg += f" ({reused} reused)"
+        return model_path, True, f"{msg} in {time.perf_counter() - t0:.2f}s"
+    except Exception:
+        return model_path, False, traceback.format_exc()
+
+
+def build_parser():
+    p = argparse.ArgumentParser(
+        prog="cli.py",
+        description="Run the ConvNet Kernel Lab analyses headlessly over trained models "
+                    "(.h5, .keras, .npz, PyTorch state_dict, ONNX, SavedModel).",
+    )
+    p.add_argument("inputs", nargs="+", help="model files and/or directories of models")
+    p.add_argument("--layout", choices=LAYOUTS,
+                   help="conv kernel layout, overriding the format's own (needed for .npz from PyTorch)")
+    p.add_argument("-o", "--out", default="results", help="output directory (default: results)")
+    p.add_argument("--sizes", type=int, nargs="+", default=[3,5,7,9,11],
+                   choices=[3,5,7,9,11], help="kernel sizes to analyze")
+    p.add_argument("--C", type=float, default=5.0, help="condition number threshold C (default: 5)")
+    p.add_argument("--precision", choices=PRECISIONS, default=None,
+                   help="float precision of the batch paths (default: CONVNET_PRECISION or float64)")
+    p.add_argument("--export", choices=["none", "csv", "kbin"], default="none",
+                   help="also export the kernels of every matched layer")
+    p.add_argument("--recondition", action="store_true",
+                   help="write reconditioned kernels of every matched layer")
+    p.add_argument("--write-back", action="store_true",
+                   help="save a copy of each model with the kernels of every matched layer "
+                        "reconditioned in place (weights only, nothing else is rebuilt)")
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                   help="worker processes: models run in parallel, or a single model's "
+                        "kernels are sharded across them (default: all cores)")
+    p.add_argument("--dedup", nargs="?", const="exact", choices=["exact", "orbit"],
+                   help="score only distinct kernels of each layer and fan the results out: "
+                        "exact duplicates (default) or whole rotation/reflection orbits")
+    p.add_argument("--near-dup", type=float, default=0.0, metavar="TOL",
+                   help="write groups of kernels within Frobenius distance TOL per layer")
+    p.add_argument("--dihedral", action="store_true",
+                   help="with --near-dup: also group rotations/reflections of a kernel")
+    p.add_argument("--incremental", action="store_true",
+                   help="treat the models as successive checkpoints: reuse results of unchanged "
+                        "layers and write a per-layer diff.csv against the previous checkpoint")
+    p.add_argument("--store", help="per-layer result store for --incremental (default: OUT/.layer_store)")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.C < 1.0 or args.workers < 1:
+        print("error: --C must be >= 1 and --workers >= 1", file=sys.stderr)
+        return EXIT_USAGE
+    models = find_models(args.inputs)
+    if not models:
+        print("error: no model files found", file=sys.stderr)
+        return EXIT_USAGE
+    outs = {}
+    for path, name in models:
+        outs.setdefault(_model_out(args.out, name), []).append(path)
+    clashes = {out: paths for out, paths in outs.items() if len(paths) > 1}
+    for out, paths in clashes.items():
+        print(f"error: {' and '.join(paths)} write to the same output folder {out}", file=sys.stderr)
+    if clashes:
+        return EXIT_USAGE
+    os.makedirs(args.out, exist_ok=True)
+
+    job = (args.sizes, args.C, args.export, args.recondition, args.write_back)
+    opts = dict(layout=args.layout, dedup=args.dedup, near_tol=args.near_dup, dihedral=args.dihedral,
+                precision=args.precision)
+    store_dir = (args.store or os.path.join(args.out, ".layer_store")) if args.incremental else None
+    failed = 0
+    ok_models = []
+
+    def report(path, ok, msg):
+        if ok:
+            print(f"ok    {path}: {msg}")
+        else:
+            print(f"FAIL  {path}\n{msg}", file=sys.stderr)
+        if ok:
+            ok_models.append(path)
+        return 0 if ok else 1
+
+    if args.incremental or args.workers == 1 or len(models) == 1:
+        # Checkpoints run in order so each one can reuse its predecessor's layers.
+        for m, name in models:
+            failed += report(*process_model(m, _model_out(args.out, name), *job, kernel_workers=args.workers,
+                                            store_dir=store_dir, **opts))
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.workers, len(models))) as pool:
+            futures = [pool.submit(process_model, m, _model_out(args.out, name), *job, **opts)
+                       for m, name in models]
+            for f in as_completed(futures):
+                failed += report(*f.result())
+
+    if args.incremental:
+        done = [(m, _model_out(args.out, name)) for m, name in models if m in ok_models]
+        for (prev, prev_out), (cur, cur_out) in zip(done, done[1:]):
+            diff = diff_summaries(pd.read_csv(os.path.join(prev_out, "summary.csv")),
+                                  pd.read_csv(os.path.join(cur_out, "summary.csv")),
+                                  prev, cur)
+            diff.to_csv(os.path.join(cur_out, "diff.csv"), index=False)
+            counts = diff["status"].value_counts()
+            print(f"diff  {cur}: " + ", ".join(f"{counts.get(k, 0)} {k}"
+                                               for k in ("changed", "unchanged", "added", "removed")))
+    print(f"{len(models) - failed}/{len(models)} models processed, results in {args.out}")
+    return EXIT_FAILED if failed else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
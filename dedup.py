@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from utils import (iter_kernel_matrices, rotate_90, rotate_180, rotate_270, reflect_vertical,
+                   reflect_horizontal, reflect_diagonal_tl_br)
+
+# Exact- and near-duplicate detection over (N, n, n) kernel stacks.
+#
+# Exact duplicates are found by hashing the raw kernel bytes (np.unique over a
+# void view). Near duplicates -- ||A - B||_F <= tol, optionally after any
+# rotation/reflection in DIHEDRAL -- use a grid index instead of all pairs:
+# kernels are projected onto a few orthonormal directions (which can
+# only shrink distances, so no true pair is lost) and bucketed in cells of
+# width 2 * tol. A neighbor within tol then lies in the query's own cell or in
+# the adjacent cell on the nearer side of each axis, 2^dims cells in total, and
+# only the candidates found there are checked with the full distance.
+#
+#   python dedup.py kernels.csv --tol 1e-3 --dihedral -o groups.csv
+#
+# Every function returns labels: for each kernel, the index of the first kernel
+# of its group. np.unique(labels, return_inverse=True) gives the unique
+# kernels to analyze and the inverse to fan their results back out.
+#
+# Dihedral orbits are grouped exactly through a canonical orientation: of the
+# eight orientations of a kernel, the lexicographically smallest. Singular
+# values and condition numbers are invariant under the group (each transform
+# permutes rows and/or columns, or transposes), so they are computed once per
+# orbit; reconditioning commutes with it and is mapped back per kernel.
+
+DEFAULT_DIMS = 4
+
+
+def reflect_antidiagonal(mat):
+    return np.swapaxes(np.flip(mat, axis=(-2, -1)), -1, -2)
+
+
+# The eight-element dihedral group of the square. utils.transformations is
+# not this group: its reflect_diagonal_tr_bl equals rotate_90, so the
+# anti-diagonal reflection is missing, and the symmetry score built on it is
+# invariant only under rotate_180 and the two diagonal reflections.
+# DIHEDRAL[INVERSE[k]] undoes DIHEDRAL[k] (only the quarter turns differ).
+DIHEDRAL = [
+    lambda mat: mat, rotate_90, rotate_180, rotate_270,
+    reflect_vertical, reflect_horizontal, reflect_diagonal_tl_br, reflect_antidiagonal,
+]
+INVERSE = np.array([0, 3, 2, 1, 4, 5, 6, 7])
+
+
+def exact_duplicate_labels(mats):
+    X = np.ascontiguousarray(np.asarray(mats).reshape(len(mats), -1) + 0.0)  # -0.0 == 0.0
+    rows = X.view(np.dtype((np.void, X.dtype.itemsize * X.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+    return first[inverse.ravel()]
+
+
+def apply_dihedral(mats, which):
+    # Applies DIHEDRAL[which[i]] to mats[i] for every kernel of a stack.
+    mats = np.asarray(mats)
+    which = np.broadcast_to(which, mats.shape[:1])
+    out = np.empty_like(mats)
+    for k, tf in enumerate(DIHEDRAL):
+        sel = which == k
+        if sel.any():
+            out[sel] = tf(mats[sel])
+    return out
+
+
+def canonical_orientation(mats):
+    # (canon, which): canon[i] == DIHEDRAL[which[i]](mats[i]) is the
+    # lexicographically smallest orientation, identical for the whole orbit.
+    # Ties (symmetric kernels) take the lowest transform index.
+    mats = np.asarray(mats) + 0.0  # -0.0 == 0.0
+    N = mats.shape[0]
+    flat = np.stack([tf(mats).reshape(N, -1) for tf in DIHEDRAL])  # (8, N, n*n)
+    alive = np.ones((len(DIHEDRAL), N), dtype=bool)
+    for d in range(flat.shape[2]):
+        v = np.where(alive, flat[:, :, d], np.inf)
+        alive &= v == v.min(axis=0)
+        if (alive.sum(axis=0) == 1).all():
+            break
+    which = alive.argmax(axis=0)
+    return flat[which, np.arange(N)].reshape(mats.shape), which
+
+
+def orbit_labels(mats):
+    # Exact grouping by dihedral orbit: kernels that are rotations or
+    # reflections of each other share a label.
+    canon, _ = canonical_orientation(mats)
+    return exact_duplicate_labels(canon)
+
+
+def orbit_hashes(mats):
+    # 64-bit hash of each kernel's canonical orientation (its shape and dtype
+    # included): a compact key that is equal across a dihedral orbit.
+    canon, _ = canonical_orientation(mats)
+    canon = np.ascontiguousarray(canon)
+    head = hashlib.blake2b(repr((canon.shape[1:], canon.dtype.str)).encode("utf-8"), digest_size=8)
+    out = np.empty(canon.shape[0], dtype=np.uint64)
+    for i, row in enumerate(canon):
+        h = head.copy()
+        h.update(row)
+        out[i] = int.from_bytes(h.digest(), "little")
+    return out
+
+
+def _union(label, i, j):
+    # Merges the components of the pairs (i, j) into label, in place: a forest
+    # in which every index points at the smallest index of its component,
+    # fully compressed again on return (label[x] is x's root).
+    while i.size:
+        li, lj = label[i], label[j]
+        m = np.minimum(li, lj)
+        np.minimum.at(label, li, m)
+        np.minimum.at(label, lj, m)
+        while True:
+            jumped = label[label]
+            if np.array_equal(jumped, label):
+                break
+            label[:] = jumped
+        keep = label[i] != label[j]
+        i, j = i[keep], j[keep]
+    return label
+
+
+def _components(N, i, j):
+    # Connected components of the pair graph, labelled by their smallest index.
+    return _union(np.arange(N), i, j)
+
+
+def _cell_codes(cells, mult):
+    # One int64 per cell; colliding cells only add candidates that the exact
+    # distance check rejects.
+    return (cells * mult).sum(axis=1)
+
+
+def _link_neighbors(X, Q, tol, label, dims, seed, budget):
+    # Unions into label every (query, point) pair with ||Q[q] - X[p]|| <= tol.
+    # Candidates are enumerated in batches of at most budget // dim pairs, so
+    # memory does not grow with the size of a dense cluster; pairs already in
+    # one component are dropped before their distance is computed, and a cell
+    # whose members all share the query's component is skipped outright.
+    rng = np.random.default_rng(seed)
+    P, _ = np.linalg.qr(rng.normal(size=(X.shape[1], min(dims, X.shape[1]))))
+    width = 2.0 * tol
+    cells = np.floor(X @ P / width).astype(np.int64)
+    mult = rng.integers(1, 2**61, size=cells.shape[1], dtype=np.int64) | 1
+    codes = _cell_codes(cells, mult)
+    order = np.argsort(codes, kind="stable")
+    uniq, start, count = np.unique(codes[order], return_index=True, return_counts=True)
+    cell_index = pd.Index(uniq)  # hash lookup of a cell code -> its position in uniq
+    max_pairs = max(1, budget // X.shape[1])
+
+    pq = Q @ P / width
+    qcells = np.floor(pq).astype(np.int64)
+    side = np.where(pq - qcells < 0.5, -1, 1)
+    queries = np.arange(Q.shape[0])
+    k = cells.shape[1]
+    for subset in range(1 << k):
+        mask = np.array([(subset >> d) & 1 for d in range(k)], dtype=np.int64)
+        pos = cell_index.get_indexer(_cell_codes(qcells + side * mask, mult))
+        has = pos >= 0
+        cell = np.where(has, pos, 0)
+        n_cand = np.where(has, count[cell], 0)
+        done = np.zeros_like(n_cand)
+        while True:
+            roots = label[order]
+            lo, hi = np.minimum.reduceat(roots, start), np.maximum.reduceat(roots, start)
+            merged = has & (lo[cell] == hi[cell]) & (lo[cell] == label[queries])
+            done[merged] = n_cand[merged]
+            rem = n_cand - done
+            cum = np.cumsum(rem)
+            if cum.size == 0 or cum[-1] == 0:
+                break
+            take = np.clip(min(max_pairs, int(cum[-1])) - (cum - rem), 0, rem)
+            qi = np.nonzero(take)[0]
+            nt = take[qi]
+            cand_q = np.repeat(qi, nt)
+            offs = np.arange(nt.sum()) - np.repeat(np.cumsum(nt) - nt, nt) + np.repeat(done[qi], nt)
+            cand_p = order[np.repeat(start[cell[qi]], nt) + offs]
+            done += take
+
+            apart = label[cand_q] != label[cand_p]
+            cand_q, cand_p = cand_q[apart], cand_p[apart]
+            d2 = ((Q[cand_q] - X[cand_p]) ** 2).sum(axis=1)
+            ok = d2 <= tol * tol
+            _union(label, cand_q[ok], cand_p[ok])
+
+
+def near_duplicate_labels(mats, tol, dihedral=False, normalize=False, dims=DEFAULT_DIMS, seed=0, budget=1 << 22):
+    # Groups kernels connected by chains of pairs within Frobenius distance tol
+    # (after scaling to unit norm with normalize, and under any dihedral
+    # transform of either kernel with dihedral). Exact duplicates are merged
+    # first, so only distinct kernels enter the index; tol == 0 is an exact
+    # match only. budget bounds the candidate pairs held at once, in values.
+    mats = np.asarray(mats, dtype=np.float64)
+    if tol <= 0:
+        if normalize:
+            norms = np.linalg.norm(mats.reshape(len(mats), -1), axis=1)
+            mats = mats / np.where(norms == 0, 1.0, norms)[:, None, None]
+        return orbit_labels(mats) if dihedral else exact_duplicate_labels(mats)
+    exact = exact_duplicate_labels(mats)
+    reps, inverse = np.unique(exact, return_inverse=True)
+    U = mats[reps]
+    if normalize:
+        norms = np.linalg.norm(U.reshape(len(U), -1), axis=1)
+        U = U / np.where(norms == 0, 1.0, norms)[:, None, None]
+    X = U.reshape(len(U), -1)
+
+    label = np.arange(len(U))
+    for tf in (DIHEDRAL if dihedral else DIHEDRAL[:1]):
+        T = np.ascontiguousarray(tf(U)).reshape(len(U), -1)
+        _link_neighbors(X, T, tol, label, dims, seed, budget)
+    return reps[label][inverse.ravel()]
+
+
+def duplicate_groups(labels):
+    # One row per group with more than one kernel: representative index,
+    # group size and its member indices.
+    labels = np.asarray(labels)
+    reps, counts = np.unique(labels, return_counts=True)
+    dup = reps[counts > 1]
+    order = np.argsort(labels, kind="stable")
+    members = np.split(order, np.cumsum(np.unique(labels[order], return_counts=True)[1])[:-1])
+    by_rep = {int(labels[m[0]]): m for m in members}
+    return pd.DataFrame({
+        "representative": dup,
+        "size": counts[counts > 1],
+        "members": [" ".join(map(str, by_rep[int(r)])) for r in dup],
+    })
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="dedup.py", description="Find exact and near-duplicate kernels.")
+    p.add_argument("input", help="kernel CSV, .kbin kernel store or .npy stack")
+    p.add_argument("--tol", type=float, default=0.0,
+                   help="Frobenius distance for near duplicates (default 0: exact duplicates only)")
+    p.add_argument("--dihedral", action="store_true",
+                   help="also match kernels that are rotations/reflections of each other")
+    p.add_argument("--normalize", action="store_true", help="compare kernels scaled to unit Frobenius norm")
+    p.add_argument("-o", "--output", help="write the duplicate groups as CSV")
+    p.add_argument("--hashes", help="write one dihedral orbit hash (16 hex digits) per kernel")
+    args = p.parse_args(argv)
+    if not os.path.isfile(args.input):
+        print(f"error: {args.input} not found", file=sys.stderr)
+        return 2
+    try:
+        mats = np.concatenate([m for m, _ in iter_kernel_matrices(args.input)])
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    if args.tol > 0 or args.dihedral or args.normalize:
+        labels = near_duplicate_labels(mats, args.tol, args.dihedral, args.normalize)
+    else:
+        labels = exact_duplicate_labels(mats)
+    groups = duplicate_groups(labels)
+    n_unique = np.unique(labels).size
+    print(f"{mats.shape[0]} kernels, {n_unique} unique, {len(groups)} duplicate groups "
+          f"({mats.shape[0] - n_unique} redundant kernels)")
+    if args.output:
+        groups.to_csv(args.output, index=False)
+    if args.hashes:
+        np.savetxt(args.hashes, orbit_hashes(mats), fmt="%016x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
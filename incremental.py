@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+from contextlib import ExitStack
+
+import numpy as np
+import pandas as pd
+
+from cache import content_key
+from weight_sources import open_weight_source
+
+# Per-layer result store for incremental re-analysis of training checkpoints.
+# Every analyzed layer is keyed by a fingerprint of its kernel tensor; results
+# (scores, condition numbers, stats and, when requested, the reconditioned
+# kernels) are stored under that fingerprint plus the parameters they depend
+# on. Unchanged layers of the next checkpoint -- frozen backbones, typically --
+# are then loaded instead of recomputed.
+#
+#   python cli.py checkpoints/ -o results/ --incremental
+#
+# writes a diff.csv per checkpoint comparing each layer with the previous one.
+
+DIFF_STATS = ("symmetry_mean", "symmetry_median", "cond_median", "cond_max", "frac_cond_above_C")
+
+
+def layer_fingerprint(kernel):
+    # Hash of the raw weights, their shape and dtype.
+    kernel = np.ascontiguousarray(kernel)
+    return content_key(kernel, kernel.shape, kernel.dtype.str)
+
+
+class LayerStore:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, fingerprint, C, recondition, dedup, layout, dtype):
+        key = content_key(None, fingerprint, float(C), bool(recondition), dedup or None, layout,
+                          None if dtype is None else np.dtype(dtype).name)
+        return os.path.join(self.root, key + ".npz")
+
+    def get(self, fingerprint, C, recondition, dedup=None, layout=None, dtype=None):
+        # (stats, arrays) or None; arrays holds scores, conds and, with
+        # recondition, rec and cond_after. Besides C and recondition, a result
+        # depends on cli.py's --dedup mode (duplicate counts in the stats), the
+        # kernel layout the matrices were cut with and the float precision.
+        path = self._path(fingerprint, C, recondition, dedup, layout, dtype)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as f:
+                arrays = {k: f[k] for k in f.files if k != "stats"}
+                stats = json.loads(f["stats"].tobytes().decode("utf-8"))
+        except (OSError, ValueError, KeyError):
+            return None
+        return stats, arrays
+
+    def put(self, fingerprint, C, recondition, stats, arrays, dedup=None, layout=None, dtype=None):
+        # Written under a temporary name and renamed, so concurrent model
+        # workers never see a partial entry.
+        path = self._path(fingerprint, C, recondition, dedup, layout, dtype)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, stats=np.frombuffer(json.dumps(stats).encode("utf-8"), dtype=np.uint8), **arrays)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def _relative_change(old_src, new_src, layer_name):
+    try:
+        old = np.asarray(old_src.read(layer_name), dtype=np.float64)
+        new = np.asarray(new_src.read(layer_name), dtype=np.float64)
+    except (OSError, KeyError, ValueError):
+        return np.nan
+    if old.shape != new.shape:
+        return np.nan
+    norm = np.linalg.norm(old)
+    return float(np.linalg.norm(new - old) / norm) if norm > 0 else np.inf
+
+
+def diff_summaries(prev, cur, prev_model=None, model=None):
+    # Per-layer comparison of two summary tables (one row per layer with a
+    # fingerprint column): status added / removed / unchanged / changed, the
+    # previous and current value of each DIFF_STATS column and their delta.
+    # With both model paths, changed layers also get the relative Frobenius
+    # change of their weights.
+    merged = prev.merge(cur, on="layer_name", how="outer", suffixes=("_prev", ""), indicator=True)
+    with ExitStack() as stack:
+        sources = None
+        both = merged[merged["_merge"] == "both"]
+        if prev_model and model and (both["fingerprint"] != both["fingerprint_prev"]).any():
+            try:
+                sources = [stack.enter_context(open_weight_source(m)) for m in (prev_model, model)]
+            except (OSError, ValueError):
+                pass
+        rows = [_diff_row(r, sources) for _, r in merged.iterrows()]
+    return pd.DataFrame(rows).sort_values("index", kind="stable").reset_index(drop=True)
+
+
+def _diff_row(r, sources):
+    # One diff_summaries row; sources are the two open models, or None.
+    if r["_merge"] == "left_only":
+        status = "removed"
+    elif r["_merge"] == "right_only":
+        status = "added"
+    else:
+        status = "unchanged" if r["fingerprint"] == r["fingerprint_prev"] else "changed"
+    row = {
+        "index": r["index"] if status != "removed" else r["index_prev"],
+        "layer_name": r["layer_name"], "status": status,
+    }
+    for k in DIFF_STATS:
+        before, after = r.get(f"{k}_prev", np.nan), r.get(k, np.nan)
+        row[f"{k}_prev"] = before
+        row[k] = after
+        row[f"{k}_delta"] = after - before
+    row["weight_change"] = 0.0 if status == "unchanged" else np.nan
+    if status == "changed" and sources:
+        row["weight_change"] = _relative_change(*sources, r["layer_name"])
+    return row
@@ -0,0 +1,285 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from cache import get_cache
+
+# Background jobs shared by every page and session of the app process. Heavy
+# analyses are submitted to a small worker pool and return a job id at once;
+# the page keeps the id in its session state and polls the job on each rerun
+# for its progress, partial result, final result or error. A widget change or
+# a second user therefore never waits behind another analysis.
+#
+# A job runs fn(job, *args, **kwargs) on a worker thread (numpy releases the
+# GIL, and the batch paths shard across processes themselves). fn reports
+# through job.report(progress, message, partial), which is also where a
+# cancellation request takes effect. Jobs submitted with the same key -- a
+# content_key of the upload and parameters -- are shared while queued, running
+# or finished; a shared job is only cancelled once every session that asked
+# for it has cancelled. A finished keyed job leaves its result in the cache
+# under its key rather than holding it, so results are bounded (and evicted)
+# by the cache budget; the last CONVNET_JOBS_KEEP finished jobs are remembered
+# so their results can be downloaded again while the cache still has them.
+
+JOB_WORKERS = int(os.environ.get("CONVNET_JOB_WORKERS", "2"))
+KEEP_FINISHED = int(os.environ.get("CONVNET_JOBS_KEEP", "64"))
+POLL_SECONDS = 0.5
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+_MISSING = object()
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, job_id, label="", key=None):
+        self.id = job_id
+        self.label = label
+        self.key = key
+        self.status = QUEUED
+        self.progress = None
+        self.message = ""
+        self.partial = None
+        self.requesters = set()
+        self._result = None
+        self.error = None
+        self.traceback = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def result(self):
+        # Keyed jobs read their result back from the cache; None once evicted.
+        return self.fetch()[1] if self.status == DONE else self._result
+
+    def fetch(self):
+        # (True, result) while a finished result is available, else (False,
+        # None). Keyed results are read from the cache once, so an eviction
+        # between a check and the read cannot hand the caller None.
+        if self.status != DONE:
+            return False, None
+        if self.key is None:
+            return True, self._result
+        value = get_cache().get(self.key, _MISSING)
+        return (False, None) if value is _MISSING else (True, value)
+
+    @property
+    def expired(self):
+        return self.status == DONE and self.key is not None and self.key not in get_cache()
+
+    def report(self, progress=None, message=None, partial=None):
+        # Called by the job function: progress in [0, 1] (None while the total
+        # is unknown), a status line and the result so far. Raises JobCancelled
+        # once cancel() was requested.
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if progress is not None:
+            self.progress = min(max(float(progress), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+        if partial is not None:
+            self.partial = partial
+
+    def cancel(self, requester=None):
+        # Withdraws requester; the job itself is cancelled once no requester is
+        # left (or at once without a requester). Queued jobs never start,
+        # running ones stop at their next report(). True if it was cancelled.
+        self.requesters.discard(requester)
+        if requester is not None and self.requesters:
+            return False
+        self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish(CANCELLED)
+        return True
+
+    def wait(self, timeout=None):
+        if self._future is not None:
+            try:
+                self._future.exception(timeout)
+            except CancelledError:
+                pass
+        return self.result
+
+    def _finish(self, status, result=None, error=None):
+        if status == DONE and self.key is not None:
+            cache = get_cache()
+            cache.put(self.key, result, persist=False)
+            if self.key not in cache:
+                # Larger than the whole cache: held here until _trim drops it.
+                self.key = None
+                self._result = result
+        else:
+            self._result = result
+        self.error = error
+        self.finished = time.time()
+        if status == DONE:
+            self.progress = 1.0
+            self.partial = None
+        self.status = status
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, keep=KEEP_FINISHED):
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="convnet-job")
+        self._jobs = OrderedDict()
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, key=None, label="", requester=None, **kwargs):
+        # Returns the job id. With key, a queued, running or finished job with
+        # the same key is returned instead of starting a new one (requester is
+        # added to it); failed, cancelled and expired jobs are resubmitted.
+        with self._lock:
+            if key is not None and key in self._by_key:
+                job = self._jobs.get(self._by_key[key])
+                if (job is not None and job.status not in (FAILED, CANCELLED) and not job.cancel_requested
+                        and not job.expired):
+                    job.requesters.add(requester)
+                    return job.id
+            job = Job(uuid.uuid4().hex[:12], label, key)
+            job.requesters.add(requester)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job.id
+            self._trim()
+        job._future = self._pool.submit(self._run, job, fn, args, kwargs)
+        return job.id
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested:
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            job._finish(CANCELLED)
+        except Exception as e:
+            job.traceback = traceback.format_exc()
+            job._finish(FAILED, error=f"{type(e).__name__}: {e}")
+        else:
+            job._finish(DONE, result=result)
+
+    def _trim(self):
+        # Drops the oldest finished jobs beyond keep; unfinished ones stay.
+        # Of the results held by jobs themselves (too large for the cache)
+        # only the newest is kept.
+        finished = [j for j in self._jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job.id]
+            if job.key is not None and self._by_key.get(job.key) == job.id:
+                del self._by_key[job.key]
+        held = [j for j in self._jobs.values() if j.done and j._result is not None]
+        for job in held[:-1]:
+            job._result = None
+
+    def get(self, job_id):
+        if job_id is None:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, requester=None):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel(requester)
+        return job
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.jobs():
+                job.cancel()
+        self._pool.shutdown(wait=True)
+
+
+_default_queue = None
+_default_lock = threading.Lock()
+
+
+def get_queue():
+    # Process-wide queue, shared like cache.get_cache().
+    global _default_queue
+    with _default_lock:
+        if _default_queue is None:
+            _default_queue = JobQueue()
+        return _default_queue
+
+
+def session_requester():
+    # A token for the current Streamlit session, kept in its session state.
+    import streamlit as st
+    if "_job_requester" not in st.session_state:
+        st.session_state["_job_requester"] = uuid.uuid4().hex
+    return st.session_state["_job_requester"]
+
+
+def submit(fn, *args, **kwargs):
+    # get_queue().submit on behalf of the current session.
+    return get_queue().submit(fn, *args, requester=session_requester(), **kwargs)
+
+
+def _withdrawn(job):
+    # This session cancelled a job that other sessions still wait for.
+    return not job.done and session_requester() not in job.requesters
+
+
+def render_job(job, key):
+    # Streamlit status of a job: a progress bar and cancel button while it is
+    # queued or running, an error or notice when it failed, was cancelled or
+    # its result was evicted. Returns (ready, result) from a single
+    # Job.fetch(); branch on ready, not on the result. Call poll() after
+    # drawing the partial result to rerun the page until the job finishes.
+    import streamlit as st
+    if job is None:
+        return False, None
+    if job.status == DONE:
+        ready, result = job.fetch()
+        if not ready:
+            st.info(f"The {(job.label or 'job').lower()} result is no longer cached; run it again.")
+        return ready, result
+    if job.status == FAILED:
+        st.error(f"{job.label or 'Job'} failed: {job.error}")
+    elif job.status == CANCELLED or _withdrawn(job):
+        st.warning(f"{job.label or 'Job'} was cancelled.")
+    else:
+        text = job.message or f"{job.label or 'Job'} {job.status}..."
+        if job.progress is None:
+            st.info(text)
+        else:
+            st.progress(job.progress, text=text)
+        if st.button("Cancel", key=f"{key}_cancel"):
+            job.cancel(session_requester())
+            st.rerun()
+    return False, None
+
+
+def poll(job, interval=POLL_SECONDS):
+    # Reruns the page after interval seconds while job is unfinished.
+    import streamlit as st
+    if job is not None and not job.done and not _withdrawn(job):
+        time.sleep(interval)
+        st.rerun()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import operator
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib import format as npformat
+
+from utils import batch_symmetry_scores, resolve_dtype, LAYOUTS
+from weight_sources import open_weight_source, layer_table, read_matrices
+
+# Persistent per-model kernel index: one row per kernel with its layer, input
+# and output channel, symmetry score, condition number and singular values.
+# The index is a directory of .npy columns (memory-mapped on open) plus a
+# layers.json table, so range and top-k queries never recompute anything:
+#
+#   python kernel_index.py build model.h5 model_index/      # any weight_sources format
+#   python kernel_index.py query model_index/ --layer conv2d_12 --top 100 --by symmetry
+#   python kernel_index.py query model_index/ --where "cond>50" "symmetry<0.2"
+
+MAX_N = 11
+COLUMNS = ("layer_id", "in_channel", "out_channel", "kernel_size", "symmetry", "cond", "singular_values")
+LAYER_COLUMNS = ("index", "name", "kernel_size", "in_channels", "out_channels", "layer_id", "start", "count")
+
+
+def build_kernel_index(src, out_dir, sizes=(3,5,7,9,11), dtype=None, chunk_size=65536, layout=None):
+    # Scores every matched conv kernel of a model once and writes the index
+    # columns through memory maps, one layer chunk at a time.
+    with open_weight_source(src, layout=layout) as source:
+        return _build(source, out_dir, sizes, resolve_dtype(dtype), chunk_size)
+
+
+def _build(source, out_dir, sizes, dtype, chunk_size):
+    table = layer_table(source, sizes)
+    layers = [{"index": int(r["index"]), "name": r["layer_name"], "kernel_size": int(r["kernel_h"]),
+               "in_channels": int(r["in_channels"]), "out_channels": int(r["out_channels"])}
+              for _, r in table[table["status"] == "matched"].iterrows()]
+    start = 0
+    for layer_id, layer in enumerate(layers):
+        layer["layer_id"] = layer_id
+        layer["start"] = start
+        layer["count"] = layer["in_channels"] * layer["out_channels"]
+        start += layer["count"]
+    N = start
+
+    os.makedirs(out_dir, exist_ok=True)
+    def column(name, col_dtype, shape=(N,)):
+        return npformat.open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+", dtype=col_dtype, shape=shape)
+    cols = {
+        "layer_id": column("layer_id", np.int32),
+        "in_channel": column("in_channel", np.int32),
+        "out_channel": column("out_channel", np.int32),
+        "kernel_size": column("kernel_size", np.int8),
+        "symmetry": column("symmetry", dtype),
+        "cond": column("cond", dtype),
+        "singular_values": column("singular_values", dtype, (N, MAX_N)),
+    }
+
+    for layer in layers:
+        mats, n, _ = read_matrices(source, layer["name"])
+        s0, cnt, out_ch = layer["start"], layer["count"], layer["out_channels"]
+        sl = slice(s0, s0 + cnt)
+        # kernels_to_matrices orders kernels as in_channel * out_channels + out_channel
+        k = np.arange(cnt)
+        cols["layer_id"][sl] = layer["layer_id"]
+        cols["in_channel"][sl] = k // out_ch
+        cols["out_channel"][sl] = k % out_ch
+        cols["kernel_size"][sl] = n
+        for c in range(0, cnt, chunk_size):
+            block = np.asarray(mats[c:c + chunk_size], dtype=dtype)
+            rows = slice(s0 + c, s0 + c + block.shape[0])
+            s = np.linalg.svd(block, compute_uv=False)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                cond = np.where(s[:, -1] == 0.0, np.inf, s[:, 0] / s[:, -1])
+            cols["cond"][rows] = cond
+            sv = np.full((block.shape[0], MAX_N), np.nan, dtype=dtype)
+            sv[:, :n] = s
+            cols["singular_values"][rows] = sv
+            cols["symmetry"][rows] = batch_symmetry_scores(block, dtype=dtype)
+
+    for col in cols.values():
+        col.flush()
+    with open(os.path.join(out_dir, "layers.json"), "w") as f:
+        json.dump({"version": 1, "count": N, "layers": layers}, f, indent=1)
+    return KernelIndex(out_dir)
+
+
+_OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq}
+_WHERE = re.compile(r"^\s*(symmetry|cond|kernel_size|in_channel|out_channel)\s*(<=|>=|==|<|>)\s*([-+0-9.eE]+|inf)\s*$")
+
+
+def parse_where(expr):
+    # "cond>50" -> ("cond", operator.gt, 50.0)
+    m = _WHERE.match(expr)
+    if m is None:
+        raise ValueError(f"cannot parse condition: {expr!r}")
+    return m.group(1), _OPS[m.group(2)], float(m.group(3))
+
+
+class KernelIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "layers.json")) as f:
+            meta = json.load(f)
+        self.layers = pd.DataFrame(meta["layers"], columns=list(LAYER_COLUMNS))
+        self.count = meta["count"]
+        self.cols = {c: np.load(os.path.join(path, f"{c}.npy"), mmap_mode="r") for c in COLUMNS}
+
+    def __len__(self):
+        return self.count
+
+    def _layer_ids(self, layer):
+        if layer is None:
+            return None
+        names = [layer] if isinstance(layer, (str, int)) else list(layer)
+        ids = []
+        for l in names:
+            if isinstance(l, str) and not l.isdigit():
+                hit = self.layers[self.layers["name"] == l]
+            else:
+                hit = self.layers[self.layers["index"] == int(l)]
+            if hit.empty:
+                raise KeyError(f"layer not in index: {l}")
+            ids.append(int(hit["layer_id"].iloc[0]))
+        return ids
+
+    def select(self, layer=None, where=()):
+        # Row ids matching a layer (name or model layer index, or a list of
+        # them) and every condition in where ("cond>50" or (column, op, value)).
+        ids = self._layer_ids(layer)
+        if ids is not None:
+            rows = np.concatenate([
+                np.arange(self.layers.loc[i, "start"], self.layers.loc[i, "start"] + self.layers.loc[i, "count"])
+                for i in ids
+            ]) if ids else np.zeros(0, dtype=np.int64)
+        else:
+            rows = None
+        for cond in where:
+            col, op, value = parse_where(cond) if isinstance(cond, str) else cond
+            data = self.cols[col]
+            if rows is None:
+                rows = np.nonzero(op(np.asarray(data), value))[0]
+            else:
+                rows = rows[op(np.asarray(data[rows]), value)]
+        return np.arange(self.count) if rows is None else rows
+
+    def top_k(self, k, by="symmetry", largest=True, layer=None, where=()):
+        rows = self.select(layer, where)
+        values = np.asarray(self.cols[by][rows], dtype=float)
+        if not largest:
+            values = -values
+        k = min(k, rows.size)
+        if k == 0:
+            return self.frame(rows[:0])
+        part = np.argpartition(-values, k - 1)[:k]
+        order = part[np.argsort(-values[part], kind="stable")]
+        return self.frame(rows[order])
+
+    def frame(self, rows):
+        names = self.layers.set_index("layer_id")["name"]
+        layer_id = np.asarray(self.cols["layer_id"][rows])
+        n = np.asarray(self.cols["kernel_size"][rows])
+        sv = np.asarray(self.cols["singular_values"][rows])
+        return pd.DataFrame({
+            "row": rows,
+            "layer_name": names.reindex(layer_id).to_numpy(),
+            "in_channel": np.asarray(self.cols["in_channel"][rows]),
+            "out_channel": np.asarray(self.cols["out_channel"][rows]),
+            "kernel_size": n,
+            "symmetry_score": np.asarray(self.cols["symmetry"][rows]),
+            "condition_number": np.asarray(self.cols["cond"][rows]),
+            "singular_values": [v[:k] for v, k in zip(sv, n)],
+        })
+
+    def query(self, layer=None, where=(), limit=None):
+        rows = self.select(layer, where)
+        return self.frame(rows if limit is None else rows[:limit])
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="kernel_index.py", description="Build and query per-model kernel indexes.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="score every conv kernel of a model into an index directory")
+    b.add_argument("model")
+    b.add_argument("index_dir")
+    b.add_argument("--sizes", type=int, nargs="+", default=[3,5,7,9,11], choices=[3,5,7,9,11])
+    b.add_argument("--precision", choices=["float64", "float32"], default=None)
+    b.add_argument("--layout", choices=LAYOUTS, help="override the model format's conv kernel layout")
+    q = sub.add_parser("query", help="range / top-k queries on an index")
+    q.add_argument("index_dir")
+    q.add_argument("--layer", nargs="+", help="layer names or model layer indexes")
+    q.add_argument("--where", nargs="+", default=[], help='conditions such as "cond>50" "symmetry<0.2"')
+    q.add_argument("--top", type=int, help="return the k best rows ordered by --by")
+    q.add_argument("--by", default="symmetry", choices=["symmetry", "cond"])
+    q.add_argument("--ascending", action="store_true", help="with --top: smallest values first")
+    q.add_argument("--limit", type=int, help="without --top: at most this many rows")
+    q.add_argument("-o", "--output", help="write the result as CSV instead of printing it")
+    args = p.parse_args(argv)
+
+    try:
+        if args.cmd == "build":
+            idx = build_kernel_index(args.model, args.index_dir, tuple(args.sizes), args.precision,
+                                     layout=args.layout)
+            print(f"indexed {len(idx)} kernels from {len(idx.layers)} layers into {args.index_dir}")
+            return 0
+        idx = KernelIndex(args.index_dir)
+        if args.top is not None:
+            df = idx.top_k(args.top, args.by, not args.ascending, args.layer, args.where)
+        else:
+            df = idx.query(args.layer, args.where, args.limit)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    if args.output:
+        df.to_csv(args.output, index=False)
+    else:
+        print(df.to_string(index=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
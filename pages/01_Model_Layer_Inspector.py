@@ -1,71 +1,65 @@
 import streamlit as st
 import numpy as np
-import pandas as pd
 from io import StringIO
-from utils import load_model_from_bytes_cached, kernels_to_matrices
+from utils import model_census, kernel_store_bytes, KERNEL_STORE_EXT
+from weight_sources import open_weight_source, layer_table, read_matrices
+from cache import cached, content_key
+from jobs import get_queue, submit, render_job, poll
 
 st.set_page_config(page_title="Model Layer Inspector", layout="wide")
 st.title("Model Layer Inspector")
 
 st.markdown(
-    "This page lets you upload a Keras `.h5` model, inspect all its layers, "
+    "This page lets you upload a trained model (Keras `.h5` or `.keras`, a PyTorch "
+    "`state_dict` checkpoint, an `.npz` of weights or an `.onnx` graph), inspect all its layers, "
     "filter convolution kernels by spatial size (3×3, 5×5, etc.), and export "
-    "the kernels of a selected layer to a CSV file for further offline analysis."
+    "the kernels of a selected layer to a CSV file or a binary `.kbin` kernel store "
+    "(raw float32 with a layer/shape header) for further offline analysis."
 )
 
-if "model" not in st.session_state:
-    st.session_state["model"] = None
+if "model_bytes" not in st.session_state:
+    st.session_state["model_bytes"] = None
 if "layers_df" not in st.session_state:
     st.session_state["layers_df"] = None
+if "model_name" not in st.session_state:
+    st.session_state["model_name"] = None
+if "census_job" not in st.session_state:
+    st.session_state["census_job"] = None
 
 sizes = st.multiselect("Select kernel sizes to include", [3,5,7,9,11], default=[3,5,7,9,11])
 show_all = st.checkbox("Show all layers", value=False)
-uploaded = st.file_uploader("Drag & drop a Keras .h5 model", type=["h5"])
+uploaded = st.file_uploader("Drag & drop a model file", type=["h5", "hdf5", "keras", "npz", "pt", "pth", "bin", "onnx"])
+layout_opt = st.radio(
+    "Conv kernel layout",
+    ["as declared by the format", "HWIO", "OIHW"],
+    horizontal=True,
+    help="Keras and .npz files default to HWIO (h, w, in, out), PyTorch and ONNX to OIHW. "
+         "Override for .npz files exported from PyTorch.",
+)
+layout = None if layout_opt.startswith("as declared") else layout_opt
 run = st.button("Show layers")
 
 if run:
     if uploaded is None:
-        st.error("please upload an .h5 model first")
+        st.error("please upload a model first")
     elif not sizes:
         st.error("please select at least one kernel size")
     else:
         st.session_state["model_bytes"] = uploaded.getvalue()
-        with st.spinner("Loading model..."):
-            st.session_state["model"] = load_model_from_bytes_cached(st.session_state["model_bytes"])
-        model = st.session_state["model"]
-        records = []
-        for idx, layer in enumerate(model.layers):
-            weights = layer.get_weights()
-            if weights and isinstance(weights[0], np.ndarray) and weights[0].ndim == 4:
-                W0 = weights[0]
-                if W0.shape[0] <= 11 and W0.shape[1] <= 11:
-                    h, w, in_ch, out_ch = W0.shape
-                else:
-                    out_ch, in_ch, h, w = W0.shape
-                num_matrices = int(in_ch) * int(out_ch)
-                status = "matched" if (h == w and h in sizes and h not in (1,2)) else "ignored_size"
-                records.append({
-                    "index": idx,
-                    "layer_name": layer.name,
-                    "kernel_h": int(h),
-                    "kernel_w": int(w),
-                    "in_channels": int(in_ch),
-                    "out_channels": int(out_ch),
-                    "num_matrices": int(num_matrices),
-                    "status": status
-                })
-            else:
-                records.append({
-                    "index": idx,
-                    "layer_name": layer.name,
-                    "kernel_h": None,
-                    "kernel_w": None,
-                    "in_channels": None,
-                    "out_channels": None,
-                    "num_matrices": 0,
-                    "status": "no_matrices"
-                })
-        st.session_state["layers_df"] = pd.DataFrame(records)
+        st.session_state["model_name"] = uploaded.name
+        model_bytes = st.session_state["model_bytes"]
+
+        def read_table():
+            with open_weight_source(model_bytes, name=uploaded.name, layout=layout) as source:
+                return layer_table(source, sizes)
+
+        try:
+            table = cached(model_bytes, read_table, "weight_layers", tuple(sizes), layout)
+        except (OSError, ValueError, KeyError) as e:
+            st.session_state["model_bytes"] = None
+            table = None
+            st.error(f"Could not read layer metadata from this file: {e}")
+        st.session_state["layers_df"] = table if table is not None and not table.empty else None
 
 if st.session_state["layers_df"] is not None:
     df = st.session_state["layers_df"]
@@ -86,31 +80,92 @@ if st.session_state["layers_df"] is not None:
         index_map = selectable["index"].tolist()
         sel = st.selectbox("Select a layer", options, key="sel_layer_option")
         sel_idx = index_map[options.index(sel)]
-        download_btn = st.button("Download matrices CSV of selected layer")
+        export_fmt = st.radio(
+            "Export format",
+            ["CSV", "Binary kernel store (.kbin, float32)"],
+            horizontal=True,
+            key="export_fmt"
+        )
+        download_btn = st.button("Download matrices of selected layer")
 
         if download_btn:
-            if st.session_state["model"] is None:
+            if st.session_state["model_bytes"] is None:
                 st.error("Model not loaded. Click 'Show layers' after uploading a model.")
             else:
-                layer = st.session_state["model"].layers[sel_idx]
-                w = layer.get_weights()
-                if not w:
-                    st.error("Selected layer has no weights")
+                row = selectable[selectable["index"] == sel_idx].iloc[0]
+                layer_name = row["layer_name"]
+                with open_weight_source(st.session_state["model_bytes"], name=st.session_state["model_name"],
+                                        layout=layout) as source:
+                    mats, h, w_ = read_matrices(source, layer_name)
+                if mats is None:
+                    st.error("Selected layer has no 4-D kernel")
+                elif export_fmt == "CSV":
+                    flat = mats.reshape(mats.shape[0], -1)
+                    sio = StringIO()
+                    np.savetxt(sio, flat, delimiter=",", fmt="%.8g")
+                    csv_bytes = sio.getvalue().encode("utf-8")
+                    st.download_button(
+                        f"Download CSV: layer{sel_idx:03d}_{layer_name}_{h}x{w_}.csv",
+                        csv_bytes,
+                        file_name=f"layer{sel_idx:03d}_{layer_name}_{h}x{w_}.csv",
+                        mime="text/csv",
+                        key=f"dl_btn_{sel_idx}"
+                    )
                 else:
-                    mats, h, w_ = kernels_to_matrices(w[0])
-                    if mats is None:
-                        st.error("Unsupported kernel tensor shape")
-                    else:
-                        flat = mats.reshape(mats.shape[0], -1)
-                        sio = StringIO()
-                        np.savetxt(sio, flat, delimiter=",", fmt="%.8g")
-                        csv_bytes = sio.getvalue().encode("utf-8")
-                        st.download_button(
-                            f"Download CSV: layer{sel_idx:03d}_{layer.name}_{h}x{w_}.csv",
-                            csv_bytes,
-                            file_name=f"layer{sel_idx:03d}_{layer.name}_{h}x{w_}.csv",
-                            mime="text/csv",
-                            key=f"dl_btn_{sel_idx}"
-                        )
+                    store_bytes = kernel_store_bytes(
+                        mats,
+                        layer_name=layer_name,
+                        in_channels=int(row["in_channels"]),
+                        out_channels=int(row["out_channels"])
+                    )
+                    st.download_button(
+                        f"Download kernel store: layer{sel_idx:03d}_{layer_name}_{h}x{w_}{KERNEL_STORE_EXT}",
+                        store_bytes,
+                        file_name=f"layer{sel_idx:03d}_{layer_name}_{h}x{w_}{KERNEL_STORE_EXT}",
+                        mime="application/octet-stream",
+                        key=f"dl_bin_{sel_idx}"
+                    )
+
+    st.divider()
+    st.subheader("Whole-model kernel census")
+    st.markdown(
+        "Reads every matched convolution layer once and summarizes symmetry scores, "
+        "condition numbers, the fraction of kernels above **C** and the mean kernel, "
+        "per layer and model-wide (one row per kernel size)."
+    )
+    census_C = st.number_input("Condition number threshold C", min_value=1.0, value=5.0, step=0.5, key="census_C")
+    census_btn = st.button("Run census")
+    if census_btn:
+        if st.session_state["model_bytes"] is None:
+            st.error("Model not loaded. Click 'Show layers' after uploading a model.")
+        else:
+            model_bytes = st.session_state["model_bytes"]
+            model_name = st.session_state["model_name"]
+            params = ("model_census", float(census_C), tuple(sizes), layout)
+
+            def run_census(job):
+                job.report(message="Analyzing all matched layers...")
+                progress = lambda layer_name: job.report(message=f"Analyzed layer {layer_name}")
+                return cached(model_bytes, lambda: model_census(model_bytes, census_C, tuple(sizes), name=model_name,
+                                                                layout=layout, progress=progress), *params)
+
+            st.session_state["census_job"] = submit(
+                run_census, key=content_key(model_bytes, "job", *params), label="Census")
+
+    census_job = get_queue().get(st.session_state["census_job"])
+    ready, census = render_job(census_job, "census")
+    if ready:
+        if census.empty:
+            st.warning("No matched convolution layers")
+        else:
+            st.dataframe(census, use_container_width=True)
+            st.download_button(
+                "Download census CSV",
+                census.to_csv(index=False).encode("utf-8"),
+                file_name="model_census.csv",
+                mime="text/csv",
+                key="dl_census"
+            )
+    poll(census_job)
 else:
     st.info("Upload a model and click 'Show layers' to proceed")
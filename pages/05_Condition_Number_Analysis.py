@@ -1,8 +1,13 @@
+import copy
 import streamlit as st
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib import ticker
+from utils import iter_kernel_matrices, CSV_CHUNK_ROWS, PRECISIONS, DEFAULT_DTYPE
+from io import BytesIO
+from cache import cached, content_key
+from parallel import parallel_condition_numbers
+from streaming_stats import StreamingStats
+from jobs import get_queue, submit, render_job, poll
 
 st.set_page_config(page_title="Condition Number Analysis", layout="wide")
 st.title("Condition Number Analysis")
@@ -13,6 +18,64 @@ st.markdown(
     "2. **Distribution Plotter** – Upload a CSV containing condition numbers to visualize their frequency distribution, including mean and median markers."
 )
 
+precision = st.sidebar.selectbox(
+    "Numeric precision",
+    PRECISIONS,
+    index=PRECISIONS.index(DEFAULT_DTYPE.name),
+    help="float32 halves memory and bandwidth; results agree with float64 to about 1e-6.",
+)
+
+if "cond_dist_job" not in st.session_state:
+    st.session_state["cond_dist_job"] = None
+
+
+def read_conditions(job, data):
+    # Runs as a background job; the running statistics after every chunk of
+    # rows are its partial result. None if the CSV has more than one column.
+    cond_acc = StreamingStats()
+    for df in pd.read_csv(BytesIO(data), chunksize=CSV_CHUNK_ROWS):
+        # find the column with numbers
+        if df.shape[1] != 1:
+            return None
+        cond_acc.update(df.iloc[:, 0].to_numpy(dtype=float))
+        job.report(message=f"Read {cond_acc.total} condition numbers", partial=copy.deepcopy(cond_acc))
+    return cond_acc
+
+
+def plot_distribution(cond_acc):
+    mean_val = float(cond_acc.mean)
+    median_val = float(cond_acc.median)
+
+    # matplotlib is imported on first plot, not at page load.
+    import matplotlib.pyplot as plt
+    from matplotlib import ticker
+
+    fig = plt.figure(figsize=(10, 6))
+    bins = 12
+
+    counts, bin_edges = cond_acc.histogram(bins)
+    plt.hist(bin_edges[:-1], bins=bin_edges, weights=counts, edgecolor='black', alpha=0.7)
+    plt.axvline(mean_val, color='red', linestyle='--', linewidth=2, label=f"Mean = {mean_val:.2f}")
+    plt.axvline(median_val, color='green', linestyle='-', linewidth=2, label=f"Median = {median_val:.2f}")
+
+    centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    labels = [f"{bin_edges[i]:.2f}–{bin_edges[i+1]:.2f}" for i in range(len(bin_edges)-1)]
+    plt.xticks(centers, labels, rotation=45, ha="right")
+
+    ax = plt.gca()
+    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    ax.set_ylim(0, counts.max() * 1.12)
+
+    plt.title("Condition Number Distribution")
+    plt.xlabel("Condition Number Range")
+    plt.ylabel("Frequency")
+    plt.legend()
+    plt.tight_layout()
+
+    st.pyplot(fig)
+    plt.close(fig)
+
+
 tabs = st.tabs(["Compute condition numbers", "Plot condition number distribution"])
 
 # ============================================================
@@ -23,21 +86,31 @@ with tabs[0]:
     st.subheader("Compute Condition Numbers from 3×3 Kernels")
 
     csv_kn = st.file_uploader(
-        "Upload CSV of flattened 3×3 matrices (9 values per row)",
-        type=["csv"],
+        "Upload CSV of flattened 3×3 matrices (9 values per row), or a .kbin/.npy kernel file",
+        type=["csv", "kbin", "npy"],
         key="cond_calc_uploader"
     )
 
     calc_btn = st.button("Compute condition numbers")
 
     if csv_kn is not None and calc_btn:
-        df = pd.read_csv(csv_kn, header=None)
+        try:
+            parts = cached(
+                csv_kn,
+                lambda: [
+                    parallel_condition_numbers(mats, backend="thread", dtype=precision)
+                    for mats, n in iter_kernel_matrices(csv_kn, dtype=precision) if n == 3
+                ],
+                "condition_numbers", precision
+            )
+            valid = bool(parts)
+        except ValueError:
+            valid = False
 
-        if df.shape[1] != 9:
+        if not valid:
             st.error("CSV must have exactly 9 columns.")
         else:
-            mats = df.values.reshape(-1, 3, 3)
-            conds = np.array([np.linalg.cond(m) for m in mats])
+            conds = np.concatenate(parts)
 
             df_out = pd.DataFrame({"condition_number": conds})
 
@@ -71,39 +144,25 @@ with tabs[1]:
     plot_btn = st.button("Plot distribution")
 
     if csv_cond is not None and plot_btn:
-        df = pd.read_csv(csv_cond)
-
-        # find the column with numbers
-        if df.shape[1] != 1:
-            st.error("CSV must contain exactly one column of condition numbers.")
-        else:
-            conds = df.iloc[:, 0].values.astype(float)
-
-            mean_val = float(np.mean(conds))
-            median_val = float(np.median(conds))
-
-            fig = plt.figure(figsize=(10, 6))
-            bins = 12
-
-            counts, bin_edges, _ = plt.hist(conds, bins=bins, edgecolor='black', alpha=0.7)
-            plt.axvline(mean_val, color='red', linestyle='--', linewidth=2, label=f"Mean = {mean_val:.2f}")
-            plt.axvline(median_val, color='green', linestyle='-', linewidth=2, label=f"Median = {median_val:.2f}")
-
-            centers = (bin_edges[:-1] + bin_edges[1:]) / 2
-            labels = [f"{bin_edges[i]:.2f}–{bin_edges[i+1]:.2f}" for i in range(len(bin_edges)-1)]
-            plt.xticks(centers, labels, rotation=45, ha="right")
-
-            ax = plt.gca()
-            ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-            ax.set_ylim(0, counts.max() * 1.12)
-
-            plt.title("Condition Number Distribution")
-            plt.xlabel("Condition Number Range")
-            plt.ylabel("Frequency")
-            plt.legend()
-            plt.tight_layout()
-
-            st.pyplot(fig)
+        data = csv_cond.getvalue()
+        st.session_state["cond_dist_job"] = submit(
+            read_conditions, data, key=content_key(data, "condition_distribution_job"), label="Reading",
+        )
 
     elif plot_btn and csv_cond is None:
         st.error("Please upload a CSV file first.")
+        st.session_state["cond_dist_job"] = None
+
+    dist_job = get_queue().get(st.session_state["cond_dist_job"])
+    ready, cond_acc = render_job(dist_job, "cond_dist")
+    if ready:
+        if cond_acc is None:
+            st.error("CSV must contain exactly one column of condition numbers.")
+        elif cond_acc.count == 0:
+            st.error("CSV contains no finite condition numbers.")
+        else:
+            plot_distribution(cond_acc)
+    elif dist_job is not None and not dist_job.done and dist_job.partial is not None:
+        if dist_job.partial.count:
+            plot_distribution(dist_job.partial)
+    poll(dist_job)
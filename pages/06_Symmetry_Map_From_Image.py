@@ -1,23 +1,28 @@
+import copy
 import streamlit as st
 import numpy as np
 from PIL import Image
 from io import BytesIO
-import matplotlib.pyplot as plt
-from matplotlib import ticker
-from utils import compute_symmetry_score
+from utils import PRECISIONS, DEFAULT_DTYPE
+from cache import cached, content_key
+from streaming_stats import score_stats, SortedScores
+from jobs import get_queue, submit, render_job, poll
+from parallel import DEFAULT_WORKERS, parallel_symmetry_map
 
 st.set_page_config(page_title="Symmetry Map From Image", layout="wide")
 st.title("Symmetry Map From Image")
 
 st.markdown(
     "This page takes an image, converts it to grayscale, and for every interior pixel "
-    "builds a 3×3 patch centered on that pixel. For each patch it computes the "
-    "symmetry score and uses that score as the new intensity value. "
-    "Border pixels are ignored, so the output image has size (H−2)×(W−2)."
+    "builds a p×p patch centered on that pixel (p = 3, 5, 7, 9 or 11). For each patch it "
+    "computes the symmetry score and uses that score as the new intensity value. "
+    "Border pixels are ignored, so the output image has size (H−p+1)×(W−p+1)."
 )
 
 if "sym_data" not in st.session_state:
     st.session_state["sym_data"] = None
+if "sym_job" not in st.session_state:
+    st.session_state["sym_job"] = None
 
 T = st.sidebar.slider(
     "Symmetry threshold T (0 = show all, 1 = highlight only very symmetric regions)",
@@ -27,71 +32,169 @@ T = st.sidebar.slider(
     step=0.01,
 )
 
+precision = st.sidebar.selectbox(
+    "Numeric precision",
+    PRECISIONS,
+    index=PRECISIONS.index(DEFAULT_DTYPE.name),
+    help="float32 halves memory and bandwidth; results agree with float64 to about 1e-6.",
+)
+
 uploaded = st.file_uploader(
     "Upload an image (PNG/JPG/JPEG). If the image is RGB it will be converted to grayscale.",
     type=["png", "jpg", "jpeg"]
 )
 
+patch_size = st.selectbox("Patch size p", [3, 5, 7, 9, 11], index=0)
 run_btn = st.button("Compute symmetry map")
 
-MAX_SIDE = 256
+
+def compute_map(job, arr, p, dtype):
+    # Runs as a background job: the map arrives in bands of output rows, each
+    # sharded across threads, and the rows finished so far plus the running
+    # score counts are the job's partial result. Bands are about a second's
+    # work on large images.
+    out_h, out_w = arr.shape[0] - p + 1, arr.shape[1] - p + 1
+    out = np.empty((out_h, out_w), dtype=dtype)
+    acc = score_stats()
+    band = max(1, min(256 * DEFAULT_WORKERS, (1 << 21) * DEFAULT_WORKERS // out_w))
+    for i in range(0, out_h, band):
+        end = min(i + band, out_h)
+        scores = parallel_symmetry_map(arr[i:end + p - 1], p, backend="thread", dtype=dtype)
+        out[i:end] = scores
+        acc.update(scores)
+        job.report(end / out_h, f"Computing symmetry map: {end}/{out_h} rows",
+                   partial=(out[:end], copy.deepcopy(acc)))
+    return out
+
+
+def analyze_map(job, data, arr, p, dtype):
+    # The threshold-independent results of an image: the raw map and its
+    # scores sorted with cumulative counts. Everything T changes is derived
+    # from these on the page.
+    out = cached(data, lambda: compute_map(job, arr, p, dtype), "symmetry_map", p, dtype)
+    job.report(message="Sorting symmetry scores...")
+    ranked = cached(data, lambda: SortedScores(out), "symmetry_map_sorted", p, dtype)
+    return out, ranked
+
+
+def png_bytes(img):
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def adjusted_png(sym_data, T, keep=8):
+    # PNG of the map stretched above T, encoded once per T (the last keep
+    # thresholds are remembered, so moving the slider back is free).
+    memo = sym_data["adjusted"]
+    if T not in memo:
+        out = sym_data["out"]
+        denom = max(1e-8, 1.0 - T)
+        out_adj = np.clip((out - T) / denom, 0.0, 1.0)
+        memo[T] = png_bytes(Image.fromarray((out_adj * 255).astype(np.uint8), mode="L"))
+        while len(memo) > keep:
+            del memo[next(iter(memo))]
+    return memo[T]
+
+
+def histogram_png(score_acc, title):
+    mean_val = float(score_acc.mean)
+    median_val = float(score_acc.median)
+
+    # matplotlib is imported on first plot, not at page load.
+    import matplotlib.pyplot as plt
+    from matplotlib import ticker
+
+    fig = plt.figure(figsize=(10, 6))
+    bins = 12
+    counts, bin_edges = score_acc.histogram(bins)
+    plt.hist(bin_edges[:-1], bins=bin_edges, weights=counts, edgecolor="black", alpha=0.7)
+
+    plt.axvline(mean_val, color="red", linestyle="--", linewidth=2, label=f"Mean = {mean_val:.3f}")
+    plt.axvline(median_val, color="green", linestyle="-", linewidth=2, label=f"Median = {median_val:.3f}")
+
+    centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+    labels = [f"{bin_edges[i]:.2f}–{bin_edges[i+1]:.2f}" for i in range(len(bin_edges) - 1)]
+    plt.xticks(centers, labels, rotation=45, ha="right")
+
+    ax = plt.gca()
+    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
+    if counts.size > 0:
+        plt.ylim(0, counts.max() * 1.12)
+
+    plt.xlabel("Symmetry score range")
+    plt.ylabel("Frequency")
+    plt.title(title)
+    plt.legend()
+    plt.tight_layout()
+
+    buf = BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
 
 if uploaded is not None and run_btn:
     img_raw = Image.open(uploaded).convert("L")
     orig_w, orig_h = img_raw.size
 
-    if max(orig_w, orig_h) > MAX_SIDE:
-        scale = MAX_SIDE / float(max(orig_w, orig_h))
-        new_w = int(orig_w * scale)
-        new_h = int(orig_h * scale)
-        img = img_raw.resize((new_w, new_h), Image.BILINEAR)
-    else:
-        img = img_raw
-
-    arr = np.array(img).astype(float)
+    arr = np.asarray(img_raw)
     H, W = arr.shape
 
-    if H < 3 or W < 3:
-        st.error("Image must be at least 3×3 after resizing.")
+    if H < patch_size or W < patch_size:
+        st.error(f"Image must be at least {patch_size}×{patch_size}.")
         st.session_state["sym_data"] = None
+        st.session_state["sym_job"] = None
     else:
-        with st.spinner("Computing symmetry map..."):
-            out_h, out_w = H - 2, W - 2
-            out = np.zeros((out_h, out_w), dtype=float)
-            for i in range(1, H - 1):
-                for j in range(1, W - 1):
-                    patch = arr[i - 1:i + 2, j - 1:j + 2]
-                    s = compute_symmetry_score(patch)
-                    out[i - 1, j - 1] = s
-
-        out = np.clip(out, 0.0, 1.0)
-        out_img = Image.fromarray((out * 255).astype(np.uint8), mode="L")
-
+        data = uploaded.getvalue()
+        st.session_state["sym_job"] = submit(
+            analyze_map, data, arr, patch_size, precision,
+            key=content_key(data, "symmetry_map_job", patch_size, precision),
+            label="Symmetry map",
+        )
         st.session_state["sym_data"] = {
             "orig_img": img_raw,
             "orig_size": (orig_h, orig_w),
             "proc_size": (H, W),
-            "out": out,
-            "out_img": out_img,
+            "out": None,
         }
 
 elif uploaded is None and run_btn:
     st.error("Please upload an image first.")
     st.session_state["sym_data"] = None
+    st.session_state["sym_job"] = None
 
 sym_data = st.session_state["sym_data"]
-
-if sym_data is not None:
+job = get_queue().get(st.session_state["sym_job"])
+
+if sym_data is not None and sym_data["out"] is None:
+    # Still computing (or failed / cancelled): show the rows finished so far.
+    ready, result = render_job(job, "sym")
+    if ready:
+        # Rendered once per map; slider reruns only look these up.
+        out, ranked = result
+        out = np.clip(out, 0.0, 1.0)
+        sym_data["out"] = out
+        sym_data["ranked"] = ranked
+        sym_data["out_png"] = png_bytes(Image.fromarray((out * 255).astype(np.uint8), mode="L"))
+        sym_data["hist_png"] = histogram_png(score_stats().update(out),
+                                                 "Symmetry Score Distribution (raw symmetry map)")
+        sym_data["adjusted"] = {}
+    else:
+        partial = job.partial if job is not None and not job.done else None
+        if partial is not None:
+            rows, running = partial
+            st.image(Image.fromarray((np.clip(rows, 0.0, 1.0) * 255).astype(np.uint8), mode="L"),
+                     caption=f"Raw symmetry map, first {rows.shape[0]} rows")
+            st.image(histogram_png(running, f"Symmetry Score Distribution (first {rows.shape[0]} rows)"))
+        poll(job)
+
+if sym_data is not None and sym_data["out"] is not None:
     orig_img = sym_data["orig_img"]
     orig_h, orig_w = sym_data["orig_size"]
     H, W = sym_data["proc_size"]
-    out = sym_data["out"]
-    out_img = sym_data["out_img"]
-    out_h, out_w = out.shape
-
-    denom = max(1e-8, 1.0 - T)
-    out_adj = np.clip((out - T) / denom, 0.0, 1.0)
-    out_adj_img = Image.fromarray((out_adj * 255).astype(np.uint8), mode="L")
+    out_h, out_w = sym_data["out"].shape
+    ranked = sym_data["ranked"]
+    adj_png = adjusted_png(sym_data, T)
 
     c1, c2, c3 = st.columns(3)
     with c1:
@@ -99,17 +202,18 @@ if sym_data is not None:
         st.image(orig_img, use_container_width=True)
     with c2:
         st.subheader(f"Raw symmetry map ({out_h}×{out_w})")
-        st.image(out_img, use_container_width=True)
+        st.image(sym_data["out_png"], use_container_width=True)
     with c3:
         st.subheader(f"Adjusted symmetry map (T = {T:.2f})")
-        st.image(out_adj_img, use_container_width=True)
+        st.image(adj_png, use_container_width=True)
+
+    above = ranked.count_above(T)
+    st.metric(f"Pixels with symmetry score above T = {T:.2f}",
+              f"{above:,} of {ranked.total:,}", f"{100.0 * ranked.fraction_above(T):.2f}%", delta_color="off")
 
-    buf = BytesIO()
-    out_adj_img.save(buf, format="PNG")
-    buf.seek(0)
     st.download_button(
         "Download adjusted symmetry map (PNG)",
-        buf.getvalue(),
+        adj_png,
         file_name=f"symmetry_map_T_{T:.2f}.png",
         mime="image/png"
     )
@@ -117,30 +221,4 @@ if sym_data is not None:
     st.divider()
     st.subheader("Distribution of symmetry scores in the raw symmetry map")
 
-    scores = out.flatten()
-    mean_val = float(np.mean(scores))
-    median_val = float(np.median(scores))
-
-    fig = plt.figure(figsize=(10, 6))
-    bins = 12
-    counts, bin_edges, _ = plt.hist(scores, bins=bins, edgecolor="black", alpha=0.7)
-
-    plt.axvline(mean_val, color="red", linestyle="--", linewidth=2, label=f"Mean = {mean_val:.3f}")
-    plt.axvline(median_val, color="green", linestyle="-", linewidth=2, label=f"Median = {median_val:.3f}")
-
-    centers = (bin_edges[:-1] + bin_edges[1:]) / 2
-    labels = [f"{bin_edges[i]:.2f}–{bin_edges[i+1]:.2f}" for i in range(len(bin_edges) - 1)]
-    plt.xticks(centers, labels, rotation=45, ha="right")
-
-    ax = plt.gca()
-    ax.yaxis.set_major_locator(ticker.MaxNLocator(integer=True))
-    if counts.size > 0:
-        plt.ylim(0, counts.max() * 1.12)
-
-    plt.xlabel("Symmetry score range")
-    plt.ylabel("Frequency")
-    plt.title("Symmetry Score Distribution (raw symmetry map)")
-    plt.legend()
-    plt.tight_layout()
-
-    st.pyplot(fig)
+    st.image(sym_data["hist_png"])
@@ -0,0 +1,209 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils import batch_symmetry_scores, batch_condition_numbers, batch_recondition_kernels, resolve_dtype, symmetry_map
+
+# Sharded execution of the batch kernel operations in utils. An (N, n, n) stack
+# is split into contiguous shards that are scored on a thread or process pool.
+# With processes, the input and every output live in shared memory: workers
+# attach by name and read/write their slice in place, nothing is pickled but
+# the shard bounds. Every kernel is computed by the same batch function as the
+# serial path and lands at its own index, so results are identical to it.
+# parallel_symmetry_map shards the output rows of a symmetry map the same way.
+
+DEFAULT_WORKERS = int(os.environ.get("CONVNET_WORKERS", "0")) or (os.cpu_count() or 1)
+MIN_SHARD = 4096
+
+
+def _symmetry(mats):
+    return (batch_symmetry_scores(mats, dtype=mats.dtype),)
+
+def _condition(mats):
+    return (batch_condition_numbers(mats, dtype=mats.dtype),)
+
+def _recondition(mats, C):
+    return batch_recondition_kernels(mats, C, dtype=mats.dtype)
+
+# op name -> (function, output shapes as a function of (N, n))
+OPS = {
+    "symmetry": (_symmetry, lambda N, n: [(N,)]),
+    "condition": (_condition, lambda N, n: [(N,)]),
+    "recondition": (_recondition, lambda N, n: [(N, n, n), (N,), (N,), (N, n), (N, n)]),
+}
+
+
+def _shards(N, workers, shard_size):
+    if shard_size is None:
+        shard_size = max(MIN_SHARD, -(-N // (workers * 4)))
+    return [(s, min(s + shard_size, N)) for s in range(0, N, shard_size)]
+
+
+def _run_shard_arrays(op, mats, outs, start, end, args):
+    fn = OPS[op][0]
+    for out, res in zip(outs, fn(mats[start:end], *args)):
+        out[start:end] = res
+
+
+def _run_shard_shm(op, dtype, in_spec, out_specs, start, end, args):
+    # Worker side: attach to the shared blocks, compute one shard, detach.
+    blocks = []
+    try:
+        name, shape = in_spec
+        blk = shared_memory.SharedMemory(name=name)
+        blocks.append(blk)
+        mats = np.ndarray(shape, dtype=dtype, buffer=blk.buf)
+        outs = []
+        for name, shape in out_specs:
+            blk = shared_memory.SharedMemory(name=name)
+            blocks.append(blk)
+            outs.append(np.ndarray(shape, dtype=dtype, buffer=blk.buf))
+        _run_shard_arrays(op, mats, outs, start, end, args)
+        del mats, outs
+    finally:
+        for blk in blocks:
+            blk.close()
+    return end - start
+
+
+def _shared_array(shape, dtype):
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    blk = shared_memory.SharedMemory(create=True, size=nbytes)
+    return blk, np.ndarray(shape, dtype=dtype, buffer=blk.buf)
+
+
+def run_sharded(op, mats, *args, workers=None, backend="process", shard_size=None, dtype=None):
+    # Returns the same tuple of arrays as the serial batch function for op.
+    dtype = resolve_dtype(dtype)
+    mats = np.asarray(mats, dtype=dtype)
+    if mats.ndim == 2:
+        mats = mats[None]
+    N, n = mats.shape[0], mats.shape[-1]
+    workers = workers or DEFAULT_WORKERS
+    shapes = OPS[op][1](N, n)
+    shards = _shards(N, workers, shard_size)
+
+    if workers == 1 or len(shards) <= 1:
+        return OPS[op][0](mats, *args)
+
+    if backend == "thread":
+        outs = [np.empty(s, dtype=dtype) for s in shapes]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda b: _run_shard_arrays(op, mats, outs, b[0], b[1], args), shards))
+        return tuple(outs)
+
+    if backend != "process":
+        raise ValueError(f"unknown backend: {backend}")
+    blocks = []
+    try:
+        in_blk, shared_in = _shared_array(mats.shape, dtype)
+        blocks.append(in_blk)
+        shared_in[...] = mats
+        out_views = []
+        for s in shapes:
+            blk, view = _shared_array(s, dtype)
+            blocks.append(blk)
+            out_views.append(view)
+        in_spec = (in_blk.name, mats.shape)
+        out_specs = [(blk.name, s) for blk, s in zip(blocks[1:], shapes)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            futures = [pool.submit(_run_shard_shm, op, dtype.str, in_spec, out_specs, a, b, args)
+                       for a, b in shards]
+            for f in futures:
+                f.result()
+        result = tuple(v.copy() for v in out_views)
+        del shared_in, out_views
+        return result
+    finally:
+        for blk in blocks:
+            blk.close()
+            blk.unlink()
+
+
+def parallel_symmetry_scores(mats, workers=None, backend="process", shard_size=None, dtype=None):
+    return run_sharded("symmetry", mats, workers=workers, backend=backend, shard_size=shard_size,
+                       dtype=dtype)[0]
+
+def parallel_condition_numbers(mats, workers=None, backend="process", shard_size=None, dtype=None):
+    return run_sharded("condition", mats, workers=workers, backend=backend, shard_size=shard_size,
+                       dtype=dtype)[0]
+
+def parallel_recondition_kernels(mats, C, workers=None, backend="process", shard_size=None, dtype=None):
+    C = max(float(C), 1.0)
+    return run_sharded("recondition", mats, C, workers=workers, backend=backend, shard_size=shard_size,
+                       dtype=dtype)
+
+
+def _map_rows(img, out, start, end, p):
+    # Output rows [start, end) of the map, from their input rows plus the
+    # p - 1 row halo below them; converted to float one shard at a time.
+    out[start:end] = symmetry_map(img[start:end + p - 1], p, dtype=out.dtype)
+
+
+def _map_rows_shm(img_spec, out_spec, start, end, p):
+    # Worker side: attach to the shared image and map, compute one shard, detach.
+    blocks = []
+    try:
+        arrays = []
+        for name, shape, dtype in (img_spec, out_spec):
+            blk = shared_memory.SharedMemory(name=name)
+            blocks.append(blk)
+            arrays.append(np.ndarray(shape, dtype=dtype, buffer=blk.buf))
+        _map_rows(*arrays, start, end, p)
+        del arrays
+    finally:
+        for blk in blocks:
+            blk.close()
+    return end - start
+
+
+def parallel_symmetry_map(img, patch_size=3, workers=None, backend="process", shard_rows=None, dtype=None):
+    # Same result as utils.symmetry_map(img, patch_size), with the output rows
+    # split into shards of shard_rows rows (by default about four per worker,
+    # and at least MIN_SHARD patches). With processes the image is shared in
+    # its own dtype (a uint8 image stays one byte per pixel) and every worker
+    # writes its rows of the map in place.
+    p = int(patch_size)
+    dtype = resolve_dtype(dtype)
+    img = np.asarray(img)
+    if img.ndim != 2 or p < 1 or img.shape[0] < p or img.shape[1] < p:
+        return None
+    out_h, out_w = img.shape[0] - p + 1, img.shape[1] - p + 1
+    workers = workers or DEFAULT_WORKERS
+    if shard_rows is None:
+        shard_rows = max(-(-MIN_SHARD // out_w), -(-out_h // (workers * 4)))
+    shards = _shards(out_h, workers, shard_rows)
+
+    if workers == 1 or len(shards) <= 1:
+        return symmetry_map(img, p, dtype=dtype)
+
+    if backend == "thread":
+        out = np.empty((out_h, out_w), dtype=dtype)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda b: _map_rows(img, out, b[0], b[1], p), shards))
+        return out
+
+    if backend != "process":
+        raise ValueError(f"unknown backend: {backend}")
+    blocks = []
+    try:
+        img_blk, shared_img = _shared_array(img.shape, img.dtype)
+        blocks.append(img_blk)
+        shared_img[...] = img
+        out_blk, shared_out = _shared_array((out_h, out_w), dtype)
+        blocks.append(out_blk)
+        img_spec = (img_blk.name, img.shape, img.dtype.str)
+        out_spec = (out_blk.name, (out_h, out_w), dtype.str)
+        with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+            futures = [pool.submit(_map_rows_shm, img_spec, out_spec, a, b, p) for a, b in shards]
+            for f in futures:
+                f.result()
+        result = shared_out.copy()
+        del shared_img, shared_out
+        return result
+    finally:
+        for blk in blocks:
+            blk.close()
+            blk.unlink()
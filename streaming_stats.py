@@ -0,0 +1,293 @@
+import math
+
+import numpy as np
+
+# Mergeable single-pass statistics for score arrays that are too large to
+# materialize: count, mean, variance, min/max, histogram counts and approximate
+# quantiles. Feed chunks with update(), combine per-worker accumulators with
+# merge(); memory is independent of the number of values.
+#
+# Quantiles come from a log-bucketed sketch (the DDSketch construction): every
+# nonzero value x falls in bucket ceil(log_gamma |x|) with
+# gamma = (1 + a) / (1 - a), and a bucket is reported by a representative within
+# relative error a of every value in it. Any quantile is therefore within
+# relative error a (default 1%) of a value of the right rank. Values with
+# |x| < min_value are counted as zero; ±inf and NaN are counted separately.
+
+
+class _Buckets:
+    # Dense bucket counts indexed from self.offset, grown on demand.
+    def __init__(self):
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, idx, counts):
+        lo, hi = int(idx.min()), int(idx.max())
+        if self.counts.size == 0:
+            self.offset = lo
+            self.counts = np.zeros(hi - lo + 1, dtype=np.int64)
+        else:
+            new_lo = min(lo, self.offset)
+            new_hi = max(hi, self.offset + self.counts.size - 1)
+            if new_lo != self.offset or new_hi != self.offset + self.counts.size - 1:
+                grown = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+                grown[self.offset - new_lo:self.offset - new_lo + self.counts.size] = self.counts
+                self.offset, self.counts = new_lo, grown
+        np.add.at(self.counts, idx - self.offset, counts)
+
+    def merge(self, other):
+        if other.counts.size:
+            nz = np.nonzero(other.counts)[0]
+            self.add(nz + other.offset, other.counts[nz])
+
+
+class StreamingStats:
+    def __init__(self, relative_accuracy=0.01, min_value=1e-12, hist_range=None, bins=12, log_bins=False):
+        # hist_range=(lo, hi) keeps exact counts over fixed bins (log-spaced
+        # with log_bins); use many fine bins there to re-bin accurately later.
+        # Without it histogram() is derived from the sketch.
+        self.relative_accuracy = float(relative_accuracy)
+        self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.min_value = float(min_value)
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.finite_min = math.inf
+        self.finite_max = -math.inf
+        self.zero_count = 0
+        self.pos_inf = 0
+        self.neg_inf = 0
+        self.nan_count = 0
+        self._pos = _Buckets()
+        self._neg = _Buckets()
+        self.hist_edges = None
+        self.hist_counts = None
+        if hist_range is not None:
+            lo, hi = hist_range
+            self.hist_edges = np.geomspace(lo, hi, bins + 1) if log_bins else np.linspace(lo, hi, bins + 1)
+            self.hist_counts = np.zeros(bins, dtype=np.int64)
+
+    def _compatible(self, other):
+        return (self.relative_accuracy == other.relative_accuracy and self.min_value == other.min_value
+                and (self.hist_edges is None) == (other.hist_edges is None)
+                and (self.hist_edges is None or np.array_equal(self.hist_edges, other.hist_edges)))
+
+    def update(self, values):
+        x = np.asarray(values, dtype=float).ravel()
+        nan = np.isnan(x)
+        self.nan_count += int(nan.sum())
+        x = x[~nan]
+        inf = np.isinf(x)
+        self.pos_inf += int((x[inf] > 0).sum())
+        self.neg_inf += int((x[inf] < 0).sum())
+        if x.size:
+            self.min = min(self.min, float(x.min()))
+            self.max = max(self.max, float(x.max()))
+        x = x[~inf]
+        if x.size == 0:
+            return self
+
+        self.finite_min = min(self.finite_min, float(x.min()))
+        self.finite_max = max(self.finite_max, float(x.max()))
+
+        # Chan et al. pairwise update of mean and sum of squared deviations.
+        n_b = x.size
+        mean_b = float(x.mean())
+        m2_b = float(((x - mean_b) ** 2).sum())
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self._m2 += m2_b + delta * delta * self.count * n_b / n
+        self.count = n
+
+        a = np.abs(x)
+        small = a < self.min_value
+        self.zero_count += int(small.sum())
+        for store, sel in ((self._pos, (x > 0) & ~small), (self._neg, (x < 0) & ~small)):
+            if sel.any():
+                idx = np.ceil(np.log(a[sel]) / self._log_gamma).astype(np.int64)
+                uniq, counts = np.unique(idx, return_counts=True)
+                store.add(uniq, counts)
+
+        if self.hist_edges is not None:
+            self.hist_counts += np.histogram(x, bins=self.hist_edges)[0]
+        return self
+
+    def merge(self, other):
+        if not self._compatible(other):
+            raise ValueError("cannot merge StreamingStats with different accuracy or histogram bins")
+        n = self.count + other.count
+        if other.count:
+            delta = other.mean - self.mean
+            self._m2 += other._m2 + delta * delta * self.count * other.count / n
+            self.mean += delta * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.finite_min = min(self.finite_min, other.finite_min)
+        self.finite_max = max(self.finite_max, other.finite_max)
+        self.zero_count += other.zero_count
+        self.pos_inf += other.pos_inf
+        self.neg_inf += other.neg_inf
+        self.nan_count += other.nan_count
+        self._pos.merge(other._pos)
+        self._neg.merge(other._neg)
+        if self.hist_counts is not None:
+            self.hist_counts += other.hist_counts
+        return self
+
+    @property
+    def nbytes(self):
+        # Memory held by the bucket and histogram counts (for the cache).
+        hist = 0 if self.hist_counts is None else self.hist_counts.nbytes + self.hist_edges.nbytes
+        return self._pos.counts.nbytes + self._neg.counts.nbytes + hist
+
+    @property
+    def total(self):
+        # All non-NaN values, including infinities (count is finite values only).
+        return self.count + self.pos_inf + self.neg_inf
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance) if self.count else math.nan
+
+    def _value(self, i):
+        return 2.0 * self.gamma ** i / (self.gamma + 1.0)
+
+    def _ordered_buckets(self):
+        # (representative values, counts) over every finite bucket, ascending.
+        values, counts = [], []
+        if self._neg.counts.size:
+            idx = np.arange(self._neg.counts.size)[::-1] + self._neg.offset
+            values.append(-self._value(idx))
+            counts.append(self._neg.counts[::-1])
+        if self.zero_count:
+            values.append(np.zeros(1))
+            counts.append(np.array([self.zero_count]))
+        if self._pos.counts.size:
+            idx = np.arange(self._pos.counts.size) + self._pos.offset
+            values.append(self._value(idx))
+            counts.append(self._pos.counts)
+        if not values:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        values, counts = np.concatenate(values), np.concatenate(counts)
+        keep = counts > 0
+        return np.clip(values[keep], self.min, self.max), counts[keep]
+
+    def quantile(self, q):
+        # Same rank convention as np.quantile's lower neighbour; q may be an array.
+        q = np.asarray(q, dtype=float)
+        total = self.total
+        if total == 0:
+            return np.full(q.shape, math.nan) if q.ndim else math.nan
+        values, counts = self._ordered_buckets()
+        values = np.concatenate([[-math.inf], values, [math.inf]])
+        cum = np.cumsum(np.concatenate([[self.neg_inf], counts, [self.pos_inf]]))
+        ranks = np.floor(q * (total - 1)).astype(np.int64)
+        res = values[np.searchsorted(cum, ranks, side="right")]
+        return res if q.ndim else float(res)
+
+    @property
+    def median(self):
+        return self.quantile(0.5)
+
+    def histogram(self, bins=None, range=None):
+        # (counts, edges). With no arguments and fixed bins given at
+        # construction, the exact counts for those bins. Otherwise `bins`
+        # equal-width bins on the finite [min, max] (or range) are filled from the finest
+        # data available: the fixed bins re-binned by their centres, or the
+        # sketch buckets placed at their representatives.
+        if self.hist_edges is not None and bins is None and range is None:
+            return self.hist_counts.copy(), self.hist_edges.copy()
+        bins = 12 if bins is None else bins
+        if self.hist_edges is not None:
+            values = 0.5 * (self.hist_edges[:-1] + self.hist_edges[1:])
+            counts = self.hist_counts
+        else:
+            values, counts = self._ordered_buckets()
+        if range is None:
+            lo, hi = (self.finite_min, self.finite_max) if self.count else (0.0, 1.0)
+        else:
+            lo, hi = range
+        if lo == hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges = np.linspace(lo, hi, bins + 1)
+        values = np.clip(values, lo, hi)
+        hist = np.histogram(values, bins=edges, weights=counts)[0].astype(np.int64)
+        return hist, edges
+
+
+class SortedScores:
+    # Threshold queries over a fixed array of scores: its distinct values in
+    # ascending order with cumulative counts, built once in O(N log N). How
+    # many values lie above or at/below a threshold is then a binary search,
+    # so a slider can be answered without touching the scores again. NaN values
+    # are dropped; infinities are kept (an inf condition number is above any C).
+    def __init__(self, values):
+        x = np.asarray(values, dtype=float).ravel()
+        x = x[~np.isnan(x)]
+        self.values, counts = np.unique(x, return_counts=True)
+        self.cumulative = np.cumsum(counts)
+        self.total = int(self.cumulative[-1]) if counts.size else 0
+
+    @property
+    def nbytes(self):
+        # Sized like the score array itself, so the cache can evict it.
+        return self.values.nbytes + self.cumulative.nbytes
+
+    def count_at_most(self, t):
+        i = int(np.searchsorted(self.values, t, side="right"))
+        return int(self.cumulative[i - 1]) if i else 0
+
+    def count_above(self, t):
+        return self.total - self.count_at_most(t)
+
+    def fraction_above(self, t):
+        return self.count_above(t) / self.total if self.total else math.nan
+
+    def quantile(self, q):
+        # Exact: the smallest value with at least ceil(q * total) values at or below it.
+        if self.total == 0:
+            return math.nan
+        rank = min(max(math.ceil(q * self.total), 1), self.total)
+        return float(self.values[np.searchsorted(self.cumulative, rank)])
+
+    def histogram(self, edges):
+        # Exact counts per [edges[i], edges[i+1]) bin (last bin closed), one
+        # binary search per edge.
+        edges = np.asarray(edges, dtype=float)
+        below = np.searchsorted(self.values, edges, side="left")
+        below[-1] = np.searchsorted(self.values, edges[-1], side="right")
+        cum = np.concatenate([[0], self.cumulative])[below]
+        return np.diff(cum)
+
+
+def score_stats():
+    # Accumulator for symmetry scores: 2000 fixed bins on [0, 1] re-bin to any
+    # plotted histogram with at most 0.0005 error on bin boundaries.
+    return StreamingStats(hist_range=(0.0, 1.0), bins=2000)
+
+
+def iter_stats(chunks, acc=None, **kwargs):
+    # Like stats_of, but yields the accumulator (acc, or a new StreamingStats)
+    # after every chunk, so running counts can be shown while the rest of the
+    # input is still being processed. The same object is yielded each time.
+    acc = StreamingStats(**kwargs) if acc is None else acc
+    for c in chunks:
+        acc.update(c)
+        yield acc
+
+
+def stats_of(chunks, **kwargs):
+    # Accumulate an iterable of arrays into one StreamingStats.
+    acc = StreamingStats(**kwargs)
+    for acc in iter_stats(chunks, acc):
+        pass
+    return acc
@@ -0,0 +1,264 @@
+import argparse
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from utils import symmetry_map
+
+# Batch symmetry maps (page 06) for image folders, .zip/.tar archives and frame
+# sequences (directories of frames, or multi-frame GIF/TIFF/APNG files):
+#
+#   python symmetry_batch.py dataset/ -o maps/ --patch-size 5 --format png -j 8
+#
+# Files are read and opened on an I/O thread pool, every frame is decoded as
+# 8-bit grayscale by its own I/O-pool job, mapped on a compute pool and
+# encoded back on the I/O pool; a bounded number of items is in flight in each
+# stage, so the stages overlap while memory stays bounded, however many frames
+# a file has. Outputs mirror the input tree and keep the input's extension:
+# <name>.<ext>.png (8-bit map) or <name>.<ext>.npy (float32 map), with _fNNNNN
+# suffixes for the frames of multi-frame files.
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".gif", ".webp")
+
+
+def iter_image_sources(src):
+    # Yields (relative name, read) pairs; read() returns the encoded bytes.
+    if os.path.isdir(src):
+        for root, _, files in os.walk(src):
+            for f in sorted(files):
+                if f.lower().endswith(IMAGE_EXTS):
+                    path = os.path.join(root, f)
+                    yield os.path.relpath(path, src), (lambda p=path: open(p, "rb").read())
+    elif zipfile.is_zipfile(src):
+        zf = zipfile.ZipFile(src)
+        for info in zf.infolist():
+            if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTS):
+                yield member_name(info.filename), (lambda i=info: zf.read(i))
+    elif tarfile.is_tarfile(src):
+        tf = tarfile.open(src)
+        lock = threading.Lock()
+        def read(m):
+            with lock:
+                return tf.extractfile(m).read()
+        for m in tf.getmembers():
+            if m.isfile() and m.name.lower().endswith(IMAGE_EXTS):
+                yield member_name(m.name), (lambda m=m: read(m))
+    elif os.path.isfile(src):
+        yield os.path.basename(src), (lambda: open(src, "rb").read())
+
+
+def member_name(name):
+    # Archive member name as a relative output path: normalized, without
+    # leading slashes; names that still climb out ("../x.png") are kept as is
+    # and rejected by output_path.
+    return os.path.normpath(name.replace("\\", "/")).lstrip("/")
+
+
+def output_path(out_dir, name, fmt):
+    # Path of one map under out_dir; ValueError if name would land outside it.
+    root = os.path.realpath(out_dir)
+    path = os.path.realpath(os.path.join(root, f"{name}.{fmt}"))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"{name!r} resolves outside the output directory")
+    return path
+
+
+class FrameReader:
+    # One opened image file (source index, name) whose frames are decoded by
+    # separate I/O-pool jobs, as 8-bit grayscale. The jobs take turns in frame
+    # order: GIF/APNG frames build on the previous one, so seeking back would
+    # decode from the first frame again.
+    def __init__(self, index, name, data):
+        self.index = index
+        self.name = name
+        self._img = Image.open(BytesIO(data))
+        self.n_frames = getattr(self._img, "n_frames", 1)
+        self._next = 0
+        self._turn = threading.Condition()
+
+    def frame(self, k):
+        with self._turn:
+            self._turn.wait_for(lambda: self._next == k)
+            try:
+                self._img.seek(k)
+                return np.asarray(self._img.convert("L"), dtype=np.uint8)
+            finally:
+                self._next = k + 1
+                self._turn.notify_all()
+
+    def out_name(self, k):
+        # The input name with its extension, so a.png and a.jpg map to
+        # a.png.png and a.jpg.png; frames get a _fNNNNN suffix.
+        return self.name if self.n_frames == 1 else f"{self.name}_f{k:05d}"
+
+
+def open_frames(index, name, read):
+    return FrameReader(index, name, read())
+
+
+def encode_map(out_dir, name, out, fmt):
+    path = output_path(out_dir, name, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if fmt == "npy":
+        np.save(path, out.astype(np.float32))
+    else:
+        out = np.clip(out, 0.0, 1.0)
+        Image.fromarray((out * 255).astype(np.uint8), mode="L").save(path)
+    return path
+
+
+def compute_map(frame_id, arr, patch_size):
+    return symmetry_map(arr, patch_size)
+
+
+def _prefetch(pool, fn, items, depth):
+    # Submit fn(*item) for each item, keeping at most `depth` futures in flight,
+    # and yield (item, future) in input order. Chaining these generators lets
+    # every stage work ahead of the one consuming it.
+    q = deque()
+    for item in items:
+        q.append((item, pool.submit(fn, *item)))
+        if len(q) >= depth:
+            yield q.popleft()
+    while q:
+        yield q.popleft()
+
+
+def run_batch(src, out_dir, patch_size=3, fmt="png", workers=None, backend="thread", progress=None):
+    # Returns (maps written, [(name, error message)]). progress(files_done,
+    # files_total, maps_written) is called whenever a map is written or fails;
+    # a file is done once every one of its frames is.
+    workers = workers or os.cpu_count() or 1
+    failures = []
+    sources = []
+    for name, read in iter_image_sources(src):
+        try:
+            output_path(out_dir, name, fmt)
+        except ValueError as e:
+            failures.append((name, str(e)))
+        else:
+            sources.append((name, read))
+    depth = 2 * workers
+    counts = {"files": 0, "maps": 0}
+    unsettled = {}   # source index -> [frames not yet written or failed, all frames queued]
+    names = {}       # (source index, frame) -> output name
+    taken = set()
+
+    def settle(frame_id=None, index=None):
+        # A frame is written or failed, or (with index) every frame of that
+        # source has been queued.
+        if index is None:
+            index = frame_id[0]
+            names.pop(frame_id)
+            unsettled[index][0] -= 1
+        else:
+            unsettled[index][1] = True
+        pending, queued = unsettled[index]
+        if queued and pending == 0:
+            del unsettled[index]
+            counts["files"] += 1
+        if progress:
+            progress(counts["files"], len(sources), counts["maps"])
+
+    def frame_jobs(opened):
+        # One decode job per frame of every file opened ahead on the I/O pool.
+        for (index, source, _), fut in opened:
+            unsettled[index] = [0, False]
+            try:
+                reader = fut.result()
+            except Exception as e:
+                failures.append((source, f"decode failed: {e}"))
+            else:
+                for k in range(reader.n_frames):
+                    out_name = reader.out_name(k)
+                    if out_name in taken:
+                        failures.append((out_name, "duplicate output name"))
+                        continue
+                    taken.add(out_name)
+                    unsettled[index][0] += 1
+                    names[index, k] = out_name
+                    yield reader, k
+            settle(index=index)
+
+    def frames(decoded):
+        for (reader, k), fut in decoded:
+            frame_id = (reader.index, k)
+            try:
+                arr = fut.result()
+            except Exception as e:
+                failures.append((names[frame_id], f"decode failed: {e}"))
+                settle(frame_id)
+                continue
+            yield frame_id, arr, patch_size
+
+    def maps(computed):
+        for (frame_id, _, _), fut in computed:
+            try:
+                out = fut.result()
+            except Exception as e:
+                failures.append((names[frame_id], f"map failed: {e}"))
+                settle(frame_id)
+                continue
+            if out is None:
+                failures.append((names[frame_id], f"smaller than {patch_size}×{patch_size}"))
+                settle(frame_id)
+            else:
+                yield frame_id, out
+
+    def encode(frame_id, out):
+        return encode_map(out_dir, names[frame_id], out, fmt)
+
+    pool_cls = ProcessPoolExecutor if backend == "process" else ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(2, workers)) as io_pool, pool_cls(max_workers=workers) as compute_pool:
+        opened = _prefetch(io_pool, open_frames, ((i, name, read) for i, (name, read) in enumerate(sources)), depth)
+        decoded = _prefetch(io_pool, FrameReader.frame, frame_jobs(opened), depth)
+        computed = _prefetch(compute_pool, compute_map, frames(decoded), depth)
+        for (frame_id, _), fut in _prefetch(io_pool, encode, maps(computed), depth):
+            try:
+                fut.result()
+                counts["maps"] += 1
+            except Exception as e:
+                failures.append((names[frame_id], f"encode failed: {e}"))
+            settle(frame_id)
+    return counts["maps"], failures
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="symmetry_batch.py",
+                                description="Compute symmetry maps for image folders, archives and frame sequences.")
+    p.add_argument("input", help="image directory, .zip/.tar archive, or a single (multi-frame) image")
+    p.add_argument("-o", "--out", default="symmetry_maps", help="output directory (default: symmetry_maps)")
+    p.add_argument("--patch-size", type=int, default=3, choices=[3, 5, 7, 9, 11])
+    p.add_argument("--format", choices=["png", "npy"], default="png",
+                   help="png: 8-bit map image; npy: raw float32 map")
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1)
+    p.add_argument("--processes", action="store_true", help="compute maps in worker processes instead of threads")
+    args = p.parse_args(argv)
+    if not os.path.exists(args.input):
+        print(f"error: {args.input} not found", file=sys.stderr)
+        return 2
+
+    t0 = time.perf_counter()
+    def progress(done, total, frames):
+        print(f"\r[{done}/{total} files] {frames} maps written", end="", file=sys.stderr, flush=True)
+
+    frames, failures = run_batch(args.input, args.out, args.patch_size, args.format, args.workers,
+                                 "process" if args.processes else "thread", progress)
+    print(file=sys.stderr)
+    for name, msg in failures:
+        print(f"FAIL  {name}: {msg}", file=sys.stderr)
+    print(f"{frames} maps in {time.perf_counter() - t0:.1f}s, results in {args.out}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import io
+import json
+import pickle
+import sys
+import types
+import zipfile
+from collections import OrderedDict
+
+import h5py
+import numpy as np
+
+
+def write_h5(path, kernels):
+    # A Keras save_weights-style .h5 with one kernel per layer name.
+    with h5py.File(path, "w") as f:
+        f.attrs["layer_names"] = [name.encode() for name in kernels]
+        for name, K in kernels.items():
+            g = f.create_group(name)
+            g.attrs["weight_names"] = [f"{name}/kernel:0".encode()]
+            g.create_dataset(f"{name}/kernel:0", data=K)
+
+
+def write_keras_zip(path, kernels):
+    # A Keras v3 .keras archive with one conv layer (kernel and bias) per
+    # kernel, plus optimizer slot variables in the same vars/ layout.
+    buf = io.BytesIO()
+    with h5py.File(buf, "w") as f:
+        for i, (name, K) in enumerate(kernels.items()):
+            f.create_dataset(f"layers/{name}/vars/0", data=K)
+            f.create_dataset(f"layers/{name}/vars/1", data=np.zeros(K.shape[-1], K.dtype))
+            f.create_dataset(f"optimizer/vars/{i}", data=K)
+    config = {"config": {"layers": [{"config": {"name": name}} for name in kernels]}}
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("config.json", json.dumps(config))
+        z.writestr("model.weights.h5", buf.getvalue())
+
+
+class _Storage:
+    def __init__(self, key, numel):
+        self.key, self.numel = key, numel
+
+
+def torch_pickle(obj):
+    # data.pkl as torch.save writes it. obj may hold Tensor placeholders
+    # (torch_pickle.Tensor(key, array)); a throwaway torch module is
+    # registered only while pickling, so the globals resolve by name.
+    torch = types.ModuleType("torch")
+    torch_utils = types.ModuleType("torch._utils")
+    FloatStorage = type("FloatStorage", (), {"__module__": "torch"})
+    def _rebuild_tensor_v2(*args):
+        pass
+    _rebuild_tensor_v2.__module__ = "torch._utils"
+    _rebuild_tensor_v2.__qualname__ = "_rebuild_tensor_v2"
+    torch.FloatStorage, torch._utils = FloatStorage, torch_utils
+    torch_utils._rebuild_tensor_v2 = _rebuild_tensor_v2
+
+    class Pickler(pickle.Pickler):
+        def persistent_id(self, obj):
+            if isinstance(obj, _Storage):
+                return ("storage", FloatStorage, obj.key, "cpu", obj.numel)
+            return None
+
+        def reducer_override(self, obj):
+            if isinstance(obj, Tensor):
+                stride = tuple(s // obj.array.itemsize for s in obj.array.strides)
+                return _rebuild_tensor_v2, (_Storage(obj.key, obj.array.size), 0, obj.array.shape, stride,
+                                            False, OrderedDict())
+            return NotImplemented
+
+    saved = {k: sys.modules.get(k) for k in ("torch", "torch._utils")}
+    sys.modules.update({"torch": torch, "torch._utils": torch_utils})
+    try:
+        buf = io.BytesIO()
+        Pickler(buf, protocol=2).dump(obj)
+        return buf.getvalue()
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                sys.modules.pop(k, None)
+            else:
+                sys.modules[k] = v
+
+
+class Tensor:
+    def __init__(self, key, array):
+        self.key, self.array = key, np.ascontiguousarray(array, dtype=np.float32)
+
+
+torch_pickle.Tensor = Tensor
+
+
+def write_torch_zip(path, data_pkl, tensors=()):
+    with zipfile.ZipFile(path, "w") as z:
+        z.writestr("archive/data.pkl", data_pkl)
+        for t in tensors:
+            z.writestr(f"archive/data/{t.key}", t.array.astype("<f4").tobytes())
+
+
+def write_state_dict(path, state_dict, wrap=None):
+    # A torch.save zip checkpoint of a {name: float32 array} state_dict,
+    # optionally nested under {wrap: state_dict}.
+    tensors = [Tensor(str(i), a) for i, a in enumerate(state_dict.values())]
+    obj = OrderedDict(zip(state_dict, tensors))
+    write_torch_zip(path, torch_pickle({wrap: obj} if wrap else obj), tensors)
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from cli import find_models, main
+from helpers import write_h5
+
+
+def test_same_named_models_get_their_own_folders(tmp_path):
+    K = np.random.default_rng(0).normal(size=(3, 3, 2, 4)).astype(np.float32)
+    for step in ("step1", "step2"):
+        os.makedirs(tmp_path / "ck" / step)
+        write_h5(tmp_path / "ck" / step / "model.h5", {"conv": K})
+
+    assert [name for _, name in find_models([str(tmp_path / "ck")])] == [
+        os.path.join("step1", "model"), os.path.join("step2", "model")]
+    assert main([str(tmp_path / "ck"), "-o", str(tmp_path / "out"), "-j", "2"]) == 0
+    for step in ("step1", "step2"):
+        assert os.path.exists(tmp_path / "out" / step / "model" / "summary.csv")
+
+    # Given as separate inputs, both would write to out/model.
+    assert main([str(tmp_path / "ck" / "step1"), str(tmp_path / "ck" / "step2"),
+                 "-o", str(tmp_path / "out2")]) == 2
+    assert not os.path.exists(tmp_path / "out2")
+
+
+def test_incremental_diff_of_same_named_checkpoints(tmp_path, capsys):
+    rng = np.random.default_rng(1)
+    K = rng.normal(size=(3, 3, 2, 4)).astype(np.float32)
+    frozen = rng.normal(size=(5, 5, 4, 4)).astype(np.float32)
+    for step, scale in (("step1", 1.0), ("step2", 1.5)):
+        os.makedirs(tmp_path / "ck" / step)
+        write_h5(tmp_path / "ck" / step / "model.h5", {"conv": K * scale + (scale - 1), "frozen": frozen})
+
+    assert main([str(tmp_path / "ck"), "-o", str(tmp_path / "out"), "--incremental"]) == 0
+    diff = pd.read_csv(tmp_path / "out" / "step2" / "model" / "diff.csv").set_index("layer_name")
+    assert diff.loc["conv", "status"] == "changed"
+    assert diff.loc["conv", "weight_change"] > 0
+    assert diff.loc["frozen", "status"] == "unchanged"
+    assert "(1 reused)" in capsys.readouterr().out
+
+
+def test_layer_store_keys_every_setting(tmp_path, capsys):
+    K = np.random.default_rng(2).normal(size=(3, 3, 3, 3)).astype(np.float32)
+    os.makedirs(tmp_path / "ck")
+    write_h5(tmp_path / "ck" / "model.h5", {"conv": K})
+    store = str(tmp_path / "store")
+    base = [str(tmp_path / "ck"), "--incremental", "--store", store]
+    runs = [[], [], ["--layout", "OIHW"], ["--precision", "float32"], ["--dedup"], ["--C", "3"]]
+    reused = []
+    for k, extra in enumerate(runs):
+        capsys.readouterr()
+        assert main(base + ["-o", str(tmp_path / f"out{k}")] + extra) == 0
+        reused.append("(1 reused)" in capsys.readouterr().out)
+    assert reused == [False, True, False, False, False, False]
@@ -0,0 +1,83 @@
+import tracemalloc
+
+import numpy as np
+
+from cli import analyze_layer
+from dedup import DIHEDRAL, _components, apply_dihedral, canonical_orientation, near_duplicate_labels, orbit_hashes
+
+
+def brute_force_labels(mats, tol, dihedral):
+    X = mats.reshape(len(mats), -1)
+    adjacent = np.zeros((len(mats), len(mats)), dtype=bool)
+    for tf in (DIHEDRAL if dihedral else DIHEDRAL[:1]):
+        T = tf(mats).reshape(len(mats), -1)
+        adjacent |= ((T[:, None] - X[None]) ** 2).sum(axis=-1) <= tol * tol
+    return _components(len(mats), *np.nonzero(adjacent))
+
+
+def same_partition(a, b):
+    return len(set(zip(a, b))) == len(np.unique(a)) == len(np.unique(b))
+
+
+def test_near_duplicates_match_brute_force():
+    rng = np.random.default_rng(0)
+    for dihedral in (False, True):
+        mats = rng.normal(size=(300, 3, 3))
+        mats[150:] = mats[:150] + rng.normal(size=(150, 3, 3)) * 0.05
+        mats[250:] = apply_dihedral(mats[250:], rng.integers(0, 8, 50))
+        labels = near_duplicate_labels(mats, 0.15, dihedral, budget=256)
+        assert same_partition(labels, brute_force_labels(mats, 0.15, dihedral))
+
+
+def test_dense_cluster_memory_is_bounded():
+    # Every pair of a dense cluster is a candidate; they must not all be built.
+    rng = np.random.default_rng(1)
+    mats = 1.0 + rng.normal(size=(20000, 3, 3)) * 1e-4
+    tracemalloc.start()
+    try:
+        labels = near_duplicate_labels(mats, 1e-2, dihedral=True)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert np.unique(labels).size == 1
+    assert peak < 256 * 2**20
+
+
+def test_orbit_hash_is_equal_across_the_orbit():
+    rng = np.random.default_rng(2)
+    for n in (3, 5):
+        mats = rng.normal(size=(40, n, n))
+        images = np.stack([tf(mats) for tf in DIHEDRAL])  # (8, N, n, n)
+        hashes = np.stack([orbit_hashes(m) for m in images])
+        assert (hashes == hashes[0]).all()
+        canon = np.stack([canonical_orientation(m)[0] for m in images])
+        assert (canon == canon[0]).all()
+
+
+def test_orbit_hashes_of_distinct_kernels_differ():
+    rng = np.random.default_rng(3)
+    mats = rng.normal(size=(5000, 3, 3))
+    assert np.unique(orbit_hashes(mats)).size == len(mats)
+    # The same values at another kernel size or dtype hash differently.
+    flat = rng.normal(size=(1, 9))
+    assert orbit_hashes(flat.reshape(1, 3, 3))[0] != orbit_hashes(flat.reshape(1, 3, 3).astype(np.float32))[0]
+
+
+def test_orbit_dedup_matches_per_kernel_analysis():
+    rng = np.random.default_rng(4)
+    mats = rng.normal(size=(120, 3, 3))
+    mats[:10] = mats[10]  # exact duplicates as well
+    mats[60:] = apply_dihedral(mats[:60], rng.integers(0, 8, 60))
+    plain_stats, plain = analyze_layer(mats, 5.0, recondition=True)
+    orbit_stats, orbit = analyze_layer(mats, 5.0, recondition=True, dedup="orbit")
+    assert orbit_stats.pop("num_unique") == 50
+    assert orbit.keys() == plain.keys()
+    # Scores are computed per kernel either way; the SVD results of an orbit
+    # member come from its canonical orientation, equal up to rounding.
+    np.testing.assert_array_equal(orbit["scores"], plain["scores"])
+    for name in plain:
+        assert orbit[name].shape == plain[name].shape
+        np.testing.assert_allclose(orbit[name], plain[name], rtol=1e-12, atol=1e-12, err_msg=name)
+    assert orbit_stats.keys() == plain_stats.keys()
+    for name, value in plain_stats.items():
+        np.testing.assert_allclose(orbit_stats[name], value, rtol=1e-12, err_msg=name)
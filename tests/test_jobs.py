@@ -0,0 +1,21 @@
+from cache import LRUCache
+import jobs
+from jobs import DONE, JobQueue
+
+
+def test_evicted_result_is_reported_once_not_as_none(monkeypatch):
+    cache = LRUCache(max_bytes=1 << 20)
+    monkeypatch.setattr(jobs, "get_cache", lambda: cache)
+    queue = JobQueue(workers=1)
+    try:
+        job = queue.get(queue.submit(lambda job: ("preview", b"csv"), key="k"))
+        job.wait()
+        assert job.status == DONE
+        assert job.fetch() == (True, ("preview", b"csv"))
+        cache.clear()
+        assert job.fetch() == (False, None)
+        assert job.expired
+        # A new submission with the same key recomputes instead of sharing.
+        assert queue.submit(lambda job: 1, key="k") != job.id
+    finally:
+        queue.shutdown()
@@ -0,0 +1,36 @@
+import numpy as np
+
+from parallel import run_sharded
+from utils import batch_condition_numbers, batch_recondition_kernels, batch_symmetry_scores
+
+
+def test_run_sharded_matches_serial():
+    rng = np.random.default_rng(0)
+    mats = rng.normal(size=(1001, 3, 3))
+    mats[::7] = 0
+    serial = {
+        "symmetry": (batch_symmetry_scores(mats),),
+        "condition": (batch_condition_numbers(mats),),
+        "recondition": batch_recondition_kernels(mats, 5.0),
+    }
+    for backend in ("thread", "process"):
+        for op, expected in serial.items():
+            args = (5.0,) if op == "recondition" else ()
+            got = run_sharded(op, mats, *args, workers=3, backend=backend, shard_size=128)
+            assert len(got) == len(expected)
+            for g, e in zip(got, expected):
+                np.testing.assert_array_equal(g, e)
+
+
+def test_parallel_symmetry_map_matches_serial():
+    from parallel import parallel_symmetry_map
+    from utils import symmetry_map
+    img = np.random.default_rng(1).integers(0, 256, size=(61, 47), dtype=np.uint8)
+    for p in (3, 5, 11):
+        expected = symmetry_map(img, p)
+        for backend in ("thread", "process"):
+            got = parallel_symmetry_map(img, p, workers=3, backend=backend, shard_rows=7)
+            np.testing.assert_array_equal(got, expected)
+        got = parallel_symmetry_map(img, p, workers=3, backend="thread", shard_rows=7, dtype="float32")
+        np.testing.assert_array_equal(got, symmetry_map(img, p, dtype="float32"))
+    assert parallel_symmetry_map(img[:2], 3, workers=3) is None
@@ -0,0 +1,97 @@
+import itertools
+
+import numpy as np
+
+from streaming_stats import SortedScores, StreamingStats, stats_of
+
+QS = np.linspace(0.0, 1.0, 101)
+
+
+def chunks_of(x, n):
+    return np.array_split(x, n)
+
+
+def test_merged_quantiles_within_relative_error():
+    rng = np.random.default_rng(0)
+    # Condition-number-like magnitudes of both signs, spanning many decades.
+    x = rng.lognormal(mean=2.0, sigma=3.0, size=50000) * rng.choice([-1.0, 1.0], size=50000)
+    for a in (0.01, 0.05):
+        parts = [stats_of([c], relative_accuracy=a) for c in chunks_of(x, 7)]
+        acc = StreamingStats(relative_accuracy=a)
+        for part in parts:
+            acc.merge(part)
+        est = acc.quantile(QS)
+        true = np.quantile(x, QS, method="lower")
+        assert np.all(np.abs(est - true) <= a * np.abs(true) * (1 + 1e-12))
+        assert acc.count == x.size
+        assert np.isclose(acc.mean, x.mean(), rtol=1e-9)
+        assert np.isclose(acc.variance, x.var(), rtol=1e-9)
+        assert (acc.min, acc.max) == (x.min(), x.max())
+
+
+def test_merge_order_does_not_matter():
+    rng = np.random.default_rng(1)
+    x = np.concatenate([rng.normal(size=3000), [0.0, np.inf, -np.inf, np.nan]])
+    rng.shuffle(x)
+    chunks = chunks_of(x, 4)
+    whole = stats_of([x], hist_range=(-4.0, 4.0), bins=50)
+    results = []
+    for order in itertools.permutations(range(len(chunks))):
+        parts = [stats_of([chunks[i]], hist_range=(-4.0, 4.0), bins=50) for i in order]
+        # Fold left, and merge pairwise as per-worker accumulators would be.
+        left = parts[0]
+        for part in parts[1:]:
+            left = left.merge(part)
+        parts = [stats_of([chunks[i]], hist_range=(-4.0, 4.0), bins=50) for i in order]
+        tree = parts[0].merge(parts[1]).merge(parts[2].merge(parts[3]))
+        results += [left, tree]
+    for acc in results:
+        np.testing.assert_array_equal(acc.quantile(QS), whole.quantile(QS))
+        np.testing.assert_array_equal(acc.histogram()[0], whole.histogram()[0])
+        np.testing.assert_array_equal(acc.histogram(bins=9)[0], whole.histogram(bins=9)[0])
+        assert (acc.count, acc.total, acc.nan_count, acc.pos_inf, acc.neg_inf, acc.zero_count) == \
+               (whole.count, whole.total, whole.nan_count, whole.pos_inf, whole.neg_inf, whole.zero_count)
+        assert np.isclose(acc.mean, whole.mean, rtol=1e-12, atol=1e-15)
+        assert np.isclose(acc.variance, whole.variance, rtol=1e-12)
+
+
+def test_sorted_scores_match_sorted_reference():
+    rng = np.random.default_rng(2)
+    # Repeated values (ties), infinities and NaNs, inserted out of order.
+    x = np.round(rng.lognormal(size=2000), 2)
+    x[:20] = np.inf
+    x[20:30] = np.nan
+    rng.shuffle(x)
+    ranked = SortedScores(x)
+    ref = np.sort(x[~np.isnan(x)])
+    N = ref.size
+    assert ranked.total == N
+    np.testing.assert_array_equal(ranked.values, np.unique(ref))
+
+    # Rank queries at every stored value, between values and outside the range.
+    thresholds = np.concatenate([np.unique(ref), np.unique(ref)[:-1] + 0.005, [-1.0, 0.0, 1e9, np.inf]])
+    for t in thresholds:
+        at_most = int(np.searchsorted(ref, t, side="right"))
+        assert ranked.count_at_most(t) == at_most
+        assert ranked.count_above(t) == N - at_most
+        assert ranked.fraction_above(t) == (N - at_most) / N
+
+    # Top k: the quantile at rank N - k + 1 is the k-th largest value, and
+    # count_above the (k+1)-th largest counts the values strictly above it.
+    for k in (1, 5, 20, 21, 100, N - 1):
+        kth = ranked.quantile((N - k + 1) / N)
+        assert kth == ref[N - k]
+        assert ranked.count_above(ref[N - k - 1]) == np.count_nonzero(ref > ref[N - k - 1])
+
+    qs = np.linspace(0.0, 1.0, 201)
+    np.testing.assert_array_equal([ranked.quantile(q) for q in qs],
+                                  np.quantile(ref, qs, method="inverted_cdf"))
+
+    edges = np.linspace(0.0, 10.0, 41)
+    np.testing.assert_array_equal(ranked.histogram(edges), np.histogram(ref, bins=edges)[0])
+
+
+def test_sorted_scores_empty():
+    ranked = SortedScores([np.nan])
+    assert ranked.total == 0 and ranked.count_at_most(1.0) == 0 and ranked.count_above(1.0) == 0
+    assert np.isnan(ranked.fraction_above(1.0)) and np.isnan(ranked.quantile(0.5))
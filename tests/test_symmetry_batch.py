@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from symmetry_batch import run_batch
+from utils import symmetry_map
+
+
+def test_run_batch_frames_and_file_progress(tmp_path):
+    rng = np.random.default_rng(0)
+    src = tmp_path / "in"
+    src.mkdir()
+    frames = [rng.integers(0, 256, (12, 16), dtype=np.uint8) for _ in range(5)]
+    Image.fromarray(frames[0]).save(src / "a.png")
+    pages = [Image.fromarray(f) for f in frames[1:]] + [Image.fromarray(frames[0][:2])]
+    pages[0].save(src / "b.tif", save_all=True, append_images=pages[1:])
+    (src / "c.png").write_bytes(b"not an image")
+
+    calls = []
+    written, failures = run_batch(str(src), str(tmp_path / "out"), 3, "npy", workers=2,
+                                  progress=lambda *a: calls.append(a))
+
+    assert written == 5
+    assert sorted(name for name, _ in failures) == ["b.tif_f00004", "c.png"]
+    assert calls[-1] == (3, 3, 5)
+    assert [c[0] for c in calls] == sorted(c[0] for c in calls)
+    out = np.load(tmp_path / "out" / "b.tif_f00002.npy")
+    np.testing.assert_allclose(out, symmetry_map(frames[3].astype(float), 3), rtol=1e-6)
+    assert os.path.exists(tmp_path / "out" / "a.png.npy")
+
+
+def test_run_batch_keeps_archive_members_inside_out_dir(tmp_path):
+    import io
+    import tarfile
+    buf = io.BytesIO()
+    Image.fromarray(np.zeros((8, 8), dtype=np.uint8)).save(buf, format="PNG")
+    data = buf.getvalue()
+    archive = tmp_path / "in.tar"
+    with tarfile.open(archive, "w") as tf:
+        for name in ("ok/a.png", "../escaped.png", "ok/../../up.png", "/abs/b.png"):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+
+    out = tmp_path / "sub" / "out"
+    written, failures = run_batch(str(archive), str(out), 3, "npy", workers=1)
+
+    assert written == 2
+    assert sorted(name for name, _ in failures) == ["../escaped.png", "../up.png"]
+    found = sorted(os.path.relpath(os.path.join(r, f), tmp_path) for r, _, fs in os.walk(tmp_path) for f in fs)
+    assert [f for f in found if f.endswith(".npy")] == ["sub/out/abs/b.png.npy", "sub/out/ok/a.png.npy"]
+
+
+def test_run_batch_same_stem_different_extensions(tmp_path):
+    src = tmp_path / "in"
+    src.mkdir()
+    a = np.random.default_rng(0).integers(0, 256, (8, 8), dtype=np.uint8)
+    Image.fromarray(a).save(src / "a.png")
+    Image.fromarray(a.T.copy()).save(src / "a.bmp")
+
+    written, failures = run_batch(str(src), str(tmp_path / "out"), 3, "npy", workers=2)
+
+    assert (written, failures) == (2, [])
+    np.testing.assert_allclose(np.load(tmp_path / "out" / "a.png.npy"), symmetry_map(a.astype(float), 3), rtol=1e-6)
+    np.testing.assert_allclose(np.load(tmp_path / "out" / "a.bmp.npy"), symmetry_map(a.T.astype(float), 3), rtol=1e-6)
@@ -0,0 +1,23 @@
+import numpy as np
+
+from utils import compute_symmetry_score, open_image_array, symmetry_map, tiled_symmetry_map
+
+
+def test_symmetry_map_matches_scalar_patches():
+    img = np.random.default_rng(0).integers(0, 256, (9, 12)).astype(float)
+    p = 3
+    expected = [[compute_symmetry_score(img[i:i + p, j:j + p]) for j in range(12 - p + 1)]
+                for i in range(9 - p + 1)]
+    np.testing.assert_allclose(symmetry_map(img, p), expected, atol=1e-12)
+
+
+def test_tiled_symmetry_map_matches_whole_image(tmp_path):
+    img = np.random.default_rng(1).integers(0, 256, (150, 203), dtype=np.uint8)
+    np.save(tmp_path / "img.npy", img)
+    src = open_image_array(str(tmp_path / "img.npy"))
+    for p in (3, 5, 11):
+        expected = symmetry_map(img, p)
+        np.testing.assert_array_equal(tiled_symmetry_map(img, p, tile=37), expected)
+        out = tiled_symmetry_map(src, p, tile=64, out_path=str(tmp_path / f"map{p}.npy"))
+        np.testing.assert_array_equal(np.load(tmp_path / f"map{p}.npy"), expected)
+        np.testing.assert_array_equal(out, expected)
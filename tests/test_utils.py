@@ -0,0 +1,82 @@
+import warnings
+
+import numpy as np
+
+from helpers import write_h5
+from utils import _quantiles, kernel_stats
+
+
+def test_condition_quantiles_with_dead_kernels():
+    rng = np.random.default_rng(0)
+    conds = rng.random(11) * 10
+    assert np.allclose(_quantiles(conds, [0.5, 0.9]), np.quantile(conds, [0.5, 0.9]))
+    mats = rng.normal(size=(10, 3, 3))
+    mats[:6] = 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        stats = kernel_stats(mats, 5)
+    assert stats["cond_median"] == np.inf and stats["cond_p90"] == np.inf
+    mats[:] = rng.normal(size=(10, 3, 3))
+    mats[:2] = 0
+    stats = kernel_stats(mats, 5)
+    assert np.isfinite(stats["cond_median"]) and stats["cond_p90"] == np.inf
+
+
+def test_recondition_h5_layers_matches_batch(tmp_path):
+    from utils import batch_recondition_kernels, kernels_to_matrices, recondition_h5_layers
+    import h5py
+    rng = np.random.default_rng(0)
+    K = rng.normal(size=(3, 3, 8, 4)).astype(np.float32)
+    K[:, :, :2] = 0
+    path = tmp_path / "m.h5"
+    write_h5(path, {"conv": K, "dead": np.zeros((3, 3, 2, 4), np.float32)})
+
+    report = recondition_h5_layers(str(path), 5.0, chunk_size=8).set_index("layer_name")
+
+    mats, _, _ = kernels_to_matrices(K, "HWIO")
+    rec, before, _, s, _ = batch_recondition_kernels(mats, 5.0)
+    expected = ((before > 5.0) & (s[:, 0] > 0)).sum()
+    assert expected > 0 and report.loc["conv", "num_reconditioned"] == expected
+    assert report.loc["dead", "num_reconditioned"] == 0
+    with h5py.File(path, "r") as f:
+        out, _, _ = kernels_to_matrices(f["conv/conv/kernel:0"][()], "HWIO")
+    np.testing.assert_allclose(out, rec.astype(np.float32), rtol=1e-6, atol=1e-6)
+
+
+def test_kernel_index_without_matched_layers(tmp_path):
+    from kernel_index import KernelIndex, build_kernel_index
+    path = tmp_path / "m.h5"
+    write_h5(path, {"conv": np.ones((3, 3, 2, 2), np.float32)})
+    build_kernel_index(str(path), str(tmp_path / "idx"), sizes=(5,))
+    index = KernelIndex(str(tmp_path / "idx"))
+    assert len(index) == 0
+    assert index.query(where=["cond>1"]).empty
+    assert index.top_k(3).empty
+
+
+def test_kernel_store_round_trip(tmp_path):
+    from io import BytesIO
+    from utils import (KERNEL_STORE_ALIGN, iter_csv_matrices, iter_kernel_matrices, kernel_store_bytes,
+                       read_kernel_store, write_kernel_store)
+    rng = np.random.default_rng(0)
+    K = rng.normal(size=(37, 5, 5)).astype(np.float32)
+    csv = tmp_path / "kernels.csv"
+    np.savetxt(csv, K.reshape(len(K), -1), delimiter=",", fmt="%.9g")  # float32 round-trips exactly
+    mats = np.concatenate([m for m, _ in iter_csv_matrices(str(csv), chunk_rows=8)])
+
+    path = tmp_path / "kernels.kbin"
+    meta = dict(layer_name="conv1", in_channels=37, out_channels=1)
+    header = write_kernel_store(str(path), mats, **meta)
+    data = kernel_store_bytes(mats, **meta)
+    assert path.read_bytes() == data
+    assert (len(data) - K.nbytes) % KERNEL_STORE_ALIGN == 0
+
+    with open(path, "rb") as f:
+        for src in (str(path), data, BytesIO(data), f):
+            got, h = read_kernel_store(src)
+            assert h == header and h["count"] == 37 and h["kernel_h"] == h["kernel_w"] == 5
+            assert got.dtype == np.float32
+            np.testing.assert_array_equal(got, K)
+            chunks = list(iter_kernel_matrices(src, chunk_rows=10))
+            assert [len(m) for m, _ in chunks] == [10, 10, 10, 7] and {n for _, n in chunks} == {5}
+            np.testing.assert_array_equal(np.concatenate([m for m, _ in chunks]), K)
@@ -0,0 +1,143 @@
+import os
+import pickle
+import sys
+import zipfile
+
+import numpy as np
+import pytest
+
+from helpers import Tensor, torch_pickle, write_h5, write_keras_zip, write_state_dict, write_torch_zip
+from weight_sources import (H5Source, KerasZipSource, NpzSource, TorchSource, kernels_to_matrices, layer_table,
+                            open_weight_source, read_matrices)
+
+SIZES = (3, 5)
+
+
+def kernels(layout):
+    # A 3×3 and a 5×5 conv kernel and a 1×1 one (ignored), in the given layout.
+    rng = np.random.default_rng(0)
+    hwio = {"conv_a": rng.normal(size=(3, 3, 2, 4)), "conv_b": rng.normal(size=(5, 5, 4, 3)),
+            "point": rng.normal(size=(1, 1, 3, 2))}
+    hwio = {k: v.astype(np.float32) for k, v in hwio.items()}
+    return hwio if layout == "HWIO" else {k: v.transpose(3, 2, 0, 1).copy() for k, v in hwio.items()}
+
+
+def check(source, expected, cls, layout):
+    assert isinstance(source, cls) and source.layout == layout
+    table = layer_table(source, SIZES).set_index("layer_name")
+    assert list(table.index) == list(expected)
+    assert list(table["status"]) == ["matched", "matched", "ignored_size"]
+    assert list(table["kernel_h"]) == [3, 5, 1]
+    assert list(table["in_channels"]) == [2, 4, 3]
+    assert list(table["out_channels"]) == [4, 3, 2]
+    for name, K in expected.items():
+        mats, h, w = read_matrices(source, name)
+        np.testing.assert_array_equal(mats, kernels_to_matrices(K, layout)[0])
+    # Matrix in_channel * out_channels + out_channel is that pair's kernel.
+    mats, _, _ = read_matrices(source, "conv_a")
+    np.testing.assert_array_equal(mats[1 * 4 + 2], kernels("HWIO")["conv_a"][:, :, 1, 2])
+
+
+def test_h5_source(tmp_path):
+    expected = kernels("HWIO")
+    write_h5(tmp_path / "m.h5", expected)
+    with open_weight_source(str(tmp_path / "m.h5")) as source:
+        check(source, expected, H5Source, "HWIO")
+    with open(tmp_path / "m.h5", "rb") as f:
+        with open_weight_source(f.read(), name="upload") as source:
+            check(source, expected, H5Source, "HWIO")
+
+
+def test_keras_source_ignores_optimizer_variables(tmp_path):
+    expected = kernels("HWIO")
+    write_keras_zip(tmp_path / "m.keras", expected)
+    with open_weight_source(str(tmp_path / "m.keras")) as source:
+        check(source, expected, KerasZipSource, "HWIO")
+
+
+def test_npz_source_and_layout_override(tmp_path):
+    expected = kernels("OIHW")
+    np.savez(tmp_path / "m.npz", **expected)
+    with open_weight_source(str(tmp_path / "m.npz"), layout="OIHW") as source:
+        check(source, expected, NpzSource, "OIHW")
+
+
+def test_torch_source(tmp_path):
+    expected = kernels("OIHW")
+    state = {}
+    for name, K in expected.items():
+        state[f"{name}.weight"] = K
+        state[f"{name}.bias"] = np.zeros(K.shape[0], np.float32)
+    write_state_dict(tmp_path / "m.pt", state)
+    with open_weight_source(str(tmp_path / "m.pt")) as source:
+        check(source, expected, TorchSource, "OIHW")
+    write_state_dict(tmp_path / "ckpt.pt", state, wrap="model_state_dict")
+    with open_weight_source(str(tmp_path / "ckpt.pt")) as source:
+        check(source, expected, TorchSource, "OIHW")
+
+
+def test_onnx_source(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    from onnx import helper, numpy_helper, TensorProto
+    expected = kernels("OIHW")
+    nodes, inits = [], []
+    x = "x"
+    for name, K in expected.items():
+        inits.append(numpy_helper.from_array(K, name=f"{name}.w"))
+        nodes.append(helper.make_node("Conv", [x, f"{name}.w"], [f"{name}.y"], name=name))
+        x = f"{name}.y"
+    graph = helper.make_graph(nodes, "g", [helper.make_tensor_value_info("x", TensorProto.FLOAT, None)],
+                              [helper.make_tensor_value_info(x, TensorProto.FLOAT, None)], inits)
+    onnx.save(helper.make_model(graph), str(tmp_path / "m.onnx"))
+    with open_weight_source(str(tmp_path / "m.onnx")) as source:
+        check(source, expected, type(source), "OIHW")
+
+
+def test_saved_model_source(tmp_path):
+    tf = pytest.importorskip("tensorflow")
+    expected = kernels("HWIO")
+    module = tf.Module()
+    for name, K in expected.items():
+        layer = tf.Module(name=name)
+        layer.kernel = tf.Variable(K)
+        setattr(module, name, layer)
+    tf.saved_model.save(module, str(tmp_path / "sm"))
+    with open_weight_source(str(tmp_path / "sm")) as source:
+        check(source, expected, type(source), "HWIO")
+
+
+@pytest.mark.parametrize("case", ["module", "list", "legacy", "keras_zip", "keras_weights", "h5_metadata"])
+def test_malformed_inputs_raise_value_error(tmp_path, case):
+    path = tmp_path / {"keras_zip": "m.keras", "keras_weights": "m.keras", "h5_metadata": "m.h5"}.get(case, "m.pt")
+    if case == "module":
+        # A whole pickled nn.Module: a global the unpickler does not allow.
+        write_torch_zip(path, b"\x80\x02ctorch.nn.modules.conv\nConv2d\n)\x81.")
+    elif case == "list":
+        t = Tensor("0", np.ones((2, 2, 3, 3)))
+        write_torch_zip(path, torch_pickle([t]), [t])
+    elif case == "legacy":
+        path.write_bytes(pickle.dumps({"conv.weight": [1.0]}))
+    elif case == "keras_zip":
+        path.write_bytes(b"PK\x03\x04 truncated")
+    elif case == "keras_weights":
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("config.json", "{}")
+            z.writestr("model.weights.h5", b"not hdf5")
+    else:
+        import h5py
+        with h5py.File(path, "w") as f:
+            f.create_dataset("w", data=np.ones(3))
+    with pytest.raises(ValueError):
+        open_weight_source(str(path))
+
+
+def test_missing_optional_packages_raise_value_error(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "onnx", None)
+    monkeypatch.setitem(sys.modules, "tensorflow", None)
+    (tmp_path / "m.onnx").write_bytes(b"\x08\x07")
+    with pytest.raises(ValueError, match="onnx"):
+        open_weight_source(str(tmp_path / "m.onnx"))
+    os.makedirs(tmp_path / "sm")
+    (tmp_path / "sm" / "saved_model.pb").write_bytes(b"")
+    with pytest.raises(ValueError, match="tensorflow"):
+        open_weight_source(str(tmp_path / "sm"))
@@ -1,8 +1,17 @@
 import numpy as np
 import pandas as pd
-import tempfile
-from io import StringIO
-from tensorflow.keras.models import load_model
+import h5py
+from PIL import Image
+import json
+import struct
+import os
+from io import BytesIO
+from numpy.lib import format as npformat
+# Kernel layouts and the Keras HDF5 readers live in weight_sources (which
+# imports nothing from here); the public ones are re-exported for the pages.
+from weight_sources import (LAYOUTS, h5_kernel_dataset, h5_layers, h5_weights_root, iter_conv_kernels,
+                            kernel_dims, kernels_to_matrices, list_h5_layers, matrices_to_kernel,
+                            open_weight_source, read_h5_kernel, resolve_layout)
 
 
 def kernel_distance(F_in: np.ndarray, F_out: np.ndarray) -> float:
@@ -13,13 +22,15 @@ def normalize_fro(mat):
     f = np.linalg.norm(mat, "fro")
     return mat if f == 0 else (mat / f)
 
-def rotate_90(mat):  return np.rot90(mat, k=1)
-def rotate_180(mat): return np.rot90(mat, k=2)
-def rotate_270(mat): return np.rot90(mat, k=3)
-def reflect_vertical(mat):   return np.fliplr(mat)
-def reflect_horizontal(mat): return np.flipud(mat)
-def reflect_diagonal_tl_br(mat): return mat.T
-def reflect_diagonal_tr_bl(mat): return np.fliplr(mat).T
+# All transforms act on the last two axes, so they apply equally to a single
+# n×n matrix and to an (N, n, n) stack of kernels.
+def rotate_90(mat):  return np.rot90(mat, k=1, axes=(-2, -1))
+def rotate_180(mat): return np.rot90(mat, k=2, axes=(-2, -1))
+def rotate_270(mat): return np.rot90(mat, k=3, axes=(-2, -1))
+def reflect_vertical(mat):   return np.flip(mat, axis=-1)
+def reflect_horizontal(mat): return np.flip(mat, axis=-2)
+def reflect_diagonal_tl_br(mat): return np.swapaxes(mat, -1, -2)
+def reflect_diagonal_tr_bl(mat): return np.swapaxes(np.flip(mat, axis=-1), -1, -2)
 
 transformations = [
     rotate_90, rotate_180, rotate_270,
@@ -27,6 +38,18 @@ transformations = [
     reflect_diagonal_tl_br, reflect_diagonal_tr_bl
 ]
 
+# Numeric precision of the batch paths. float64 is the reference; float32
+# halves memory and bandwidth for bulk screening (see README for tolerances).
+# CONVNET_PRECISION sets the default, every batch function also takes dtype=.
+PRECISIONS = ("float64", "float32")
+DEFAULT_DTYPE = np.dtype(os.environ.get("CONVNET_PRECISION", "float64"))
+
+def resolve_dtype(dtype=None):
+    dtype = DEFAULT_DTYPE if dtype is None else np.dtype(dtype)
+    if dtype.name not in PRECISIONS:
+        raise ValueError(f"unsupported precision: {dtype}")
+    return dtype
+
 def compute_symmetry_score(mat):
     nk = normalize_fro(mat)
     d = [np.linalg.norm(tf(nk) - nk, "fro") for tf in transformations]
@@ -34,32 +57,231 @@ def compute_symmetry_score(mat):
     s = 1.0 - 0.5 * avg
     return float(np.clip(s, 0.0, 1.0))
 
-def parse_csv_matrices(csv_bytes):
-    df = pd.read_csv(StringIO(csv_bytes.decode("utf-8")), header=None)
-    n2 = df.shape[1]
-    n = int(np.sqrt(n2))
-    if n * n != n2 or n not in (3,5,7,9,11):
+def _symmetry_scores_block(block):
+    # Scores for every n×n matrix in the trailing axes of an (..., n, n) array.
+    # ‖T(x/f) − x/f‖ = ‖T(x) − x‖ / f, so the block is never normalized in place.
+    f = np.sqrt(np.einsum("...ij,...ij->...", block, block))
+    total = np.zeros(block.shape[:-2], dtype=block.dtype)
+    for tf in transformations:
+        d = tf(block) - block
+        total += np.sqrt(np.einsum("...ij,...ij->...", d, d))
+    avg = total / (len(transformations) * np.where(f == 0, 1.0, f))
+    return np.clip(1.0 - 0.5 * avg, 0.0, 1.0)
+
+def batch_symmetry_scores(mats, chunk_size=65536, dtype=None):
+    # Vectorized compute_symmetry_score over an (N, n, n) stack. Kernels are
+    # processed in blocks so the per-transform temporaries stay cache sized.
+    dtype = resolve_dtype(dtype)
+    mats = np.asarray(mats, dtype=dtype)
+    if mats.ndim == 2:
+        mats = mats[None]
+    N = mats.shape[0]
+    scores = np.empty(N, dtype=dtype)
+    for start in range(0, N, chunk_size):
+        block = mats[start:start + chunk_size]
+        scores[start:start + block.shape[0]] = _symmetry_scores_block(block)
+    return scores
+
+def symmetry_map(arr, patch_size=3, block_elems=1 << 22, dtype=None):
+    # Symmetry score of every patch_size×patch_size patch of a 2-D image. Patches
+    # are strided views into the image; rows are scored in bands of roughly
+    # block_elems patch values so temporaries stay bounded for large images.
+    dtype = resolve_dtype(dtype)
+    arr = np.asarray(arr, dtype=dtype)
+    p = int(patch_size)
+    H, W = arr.shape
+    if p < 1 or H < p or W < p:
+        return None
+    windows = np.lib.stride_tricks.sliding_window_view(arr, (p, p))
+    out_h, out_w = windows.shape[:2]
+    out = np.empty((out_h, out_w), dtype=dtype)
+    band = max(1, block_elems // (out_w * p * p))
+    for i in range(0, out_h, band):
+        out[i:i + band] = _symmetry_scores_block(windows[i:i + band])
+    return out
+
+CSV_CHUNK_ROWS = 65536
+
+def iter_csv_matrices(src, chunk_rows=CSV_CHUNK_ROWS, dtype=None):
+    # Stream a CSV of flattened n×n kernels (one per row) as (mats, n) blocks of
+    # at most chunk_rows kernels. src may be bytes, a path or a binary file-like
+    # object (e.g. a Streamlit upload). Raises ValueError for unsupported shapes.
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        src = BytesIO(src)
+    elif hasattr(src, "seek"):
+        src.seek(0)
+    dtype = resolve_dtype(dtype)
+    n = None
+    for df in pd.read_csv(src, header=None, chunksize=chunk_rows, dtype=dtype):
+        if n is None:
+            n2 = df.shape[1]
+            n = int(np.sqrt(n2))
+            if n * n != n2 or n not in (3,5,7,9,11):
+                raise ValueError(f"unsupported CSV shape: {n2} columns per row")
+        yield df.to_numpy(dtype=dtype).reshape(-1, n, n), n
+
+def parse_csv_matrices(csv_bytes, dtype=None):
+    try:
+        chunks = [mats for mats, n in iter_csv_matrices(csv_bytes, dtype=dtype)]
+    except ValueError:
+        return None, None
+    if not chunks:
         return None, None
-    mats = df.values.reshape(-1, n, n)
-    return mats, n
-
-def load_model_from_bytes_cached(b):
-    with tempfile.NamedTemporaryFile(suffix=".h5", delete=False) as tmp:
-        tmp.write(b)
-        tmp_path = tmp.name
-    return load_model(tmp_path, compile=False)
-
-def kernels_to_matrices(K):
-    if K.ndim != 4:
-        return None, None, None
-    if K.shape[0] <= 11 and K.shape[1] <= 11:
-        h, w, in_ch, out_ch = K.shape
-        mats = np.transpose(K, (2, 3, 0, 1))
+    mats = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+    return mats, mats.shape[-1]
+
+# Binary kernel store: an 8-byte magic, a little-endian uint32 header length, a
+# JSON header (layer name, kernel shape, channel layout, count) padded so the
+# data starts on a 64-byte boundary, then the (N, h, w) kernels as raw float32.
+KERNEL_STORE_MAGIC = b"CNKSTORE"
+KERNEL_STORE_EXT = ".kbin"
+KERNEL_STORE_ALIGN = 64
+
+def write_kernel_store(dst, mats, layer_name="", in_channels=None, out_channels=None,
+                       layout="in_out_hw"):
+    # layout names the order of the N matrices; "in_out_hw" is the order produced
+    # by kernels_to_matrices (index = in_channel * out_channels + out_channel).
+    mats = np.ascontiguousarray(mats, dtype="<f4")
+    N, h, w = mats.shape
+    header = {
+        "version": 1,
+        "layer_name": layer_name,
+        "kernel_h": int(h),
+        "kernel_w": int(w),
+        "in_channels": None if in_channels is None else int(in_channels),
+        "out_channels": None if out_channels is None else int(out_channels),
+        "layout": layout,
+        "count": int(N),
+        "dtype": "<f4",
+    }
+    hb = json.dumps(header).encode("utf-8")
+    pad = -(len(KERNEL_STORE_MAGIC) + 4 + len(hb)) % KERNEL_STORE_ALIGN
+    hb += b" " * pad
+    prefix = KERNEL_STORE_MAGIC + struct.pack("<I", len(hb)) + hb
+    if isinstance(dst, (str, os.PathLike)):
+        with open(dst, "wb") as f:
+            f.write(prefix)
+            f.write(memoryview(mats).cast("B"))
     else:
-        out_ch, in_ch, h, w = K.shape
-        mats = np.transpose(K, (1, 0, 2, 3))
-    mats = mats.reshape(-1, h, w)
-    return mats, h, w
+        dst.write(prefix)
+        dst.write(memoryview(mats).cast("B"))
+    return header
+
+def kernel_store_bytes(mats, **meta):
+    buf = BytesIO()
+    write_kernel_store(buf, mats, **meta)
+    return buf.getvalue()
+
+def _read_store_header(read):
+    # read(k) returns the next k bytes of the store.
+    if bytes(read(len(KERNEL_STORE_MAGIC))) != KERNEL_STORE_MAGIC:
+        raise ValueError("not a kernel store")
+    (hlen,) = struct.unpack("<I", bytes(read(4)))
+    header = json.loads(bytes(read(hlen)).decode("utf-8"))
+    return header, len(KERNEL_STORE_MAGIC) + 4 + hlen
+
+def _as_buffer(src):
+    # Zero-copy view of in-memory data (bytes, BytesIO or a Streamlit upload).
+    if hasattr(src, "getbuffer"):
+        return src.getbuffer()
+    if hasattr(src, "read"):
+        src.seek(0)
+        return memoryview(src.read())
+    return memoryview(src)
+
+def read_kernel_store(src):
+    # Returns (mats, header) without parsing or copying the kernel data: a
+    # read-only np.memmap for paths, a np.frombuffer view for in-memory files.
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as f:
+            header, offset = _read_store_header(f.read)
+        shape = (header["count"], header["kernel_h"], header["kernel_w"])
+        mats = np.memmap(src, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+        return mats, header
+    buf = _as_buffer(src)
+    pos = [0]
+    def read(k):
+        chunk = buf[pos[0]:pos[0] + k]
+        pos[0] += k
+        return chunk
+    header, offset = _read_store_header(read)
+    shape = (header["count"], header["kernel_h"], header["kernel_w"])
+    mats = np.frombuffer(buf, dtype=header["dtype"], count=int(np.prod(shape)), offset=offset)
+    return mats.reshape(shape), header
+
+def _read_npy(src):
+    # .npy files of shape (N, n, n) or (N, n*n), memory-mapped or viewed in place.
+    if isinstance(src, (str, os.PathLike)):
+        return np.load(src, mmap_mode="r", allow_pickle=False)
+    buf = _as_buffer(src)
+    bio = BytesIO(buf)
+    version = npformat.read_magic(bio)
+    if version == (1, 0):
+        shape, fortran_order, dtype = npformat.read_array_header_1_0(bio)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = npformat.read_array_header_2_0(bio)
+    else:
+        fortran_order, dtype = True, None
+    if fortran_order or dtype.hasobject:
+        bio.seek(0)
+        return np.load(bio, allow_pickle=False)
+    arr = np.frombuffer(buf, dtype=dtype, count=int(np.prod(shape)), offset=bio.tell())
+    return arr.reshape(shape)
+
+def _sniff(src):
+    if isinstance(src, (str, os.PathLike)):
+        with open(src, "rb") as f:
+            return f.read(8)
+    if hasattr(src, "getbuffer"):
+        return bytes(src.getbuffer()[:8])
+    if hasattr(src, "read"):
+        src.seek(0)
+        head = src.read(8)
+        src.seek(0)
+        return head
+    return bytes(src[:8])
+
+def load_kernel_matrices(src):
+    # Kernel stack from a kernel store or .npy file, plus the store header (or
+    # None for .npy). Returns (None, None) for anything else.
+    head = _sniff(src)
+    if head.startswith(KERNEL_STORE_MAGIC):
+        return read_kernel_store(src)
+    if head.startswith(b"\x93NUMPY"):
+        mats = _read_npy(src)
+        if mats.ndim == 2:
+            n = int(np.sqrt(mats.shape[1]))
+            if n * n == mats.shape[1]:
+                mats = mats.reshape(-1, n, n)
+        if mats.ndim == 3 and mats.shape[1] == mats.shape[2]:
+            return mats, None
+    return None, None
+
+def iter_kernel_matrices(src, chunk_rows=CSV_CHUNK_ROWS, dtype=None):
+    # Like iter_csv_matrices, but also accepts kernel stores and .npy files,
+    # which are sliced in place instead of parsed.
+    head = _sniff(src)
+    if not (head.startswith(KERNEL_STORE_MAGIC) or head.startswith(b"\x93NUMPY")):
+        yield from iter_csv_matrices(src, chunk_rows, dtype)
+        return
+    mats, _ = load_kernel_matrices(src)
+    if mats is None or mats.shape[-1] not in (3,5,7,9,11):
+        raise ValueError("unsupported kernel array shape")
+    n = mats.shape[-1]
+    dtype = resolve_dtype(dtype)
+    for start in range(0, mats.shape[0], chunk_rows):
+        yield np.asarray(mats[start:start + chunk_rows], dtype=dtype), n
+
+def chunked_mean_kernel(chunks):
+    # Mean kernel over an iterable of (mats, n) blocks using a running sum.
+    total, count, n = None, 0, None
+    for mats, n in chunks:
+        part = mats.sum(axis=0, dtype=np.float64)
+        total = part if total is None else total + part
+        count += mats.shape[0]
+    if count == 0:
+        return None, None, 0
+    return total / count, n, count
 
 def recondition_kernel(F, C):
     C = max(float(C), 1.0)
@@ -84,3 +306,253 @@ def recondition_kernel(F, C):
     sigma_min_after = float(s_new[-1])
     cond_after = np.inf if sigma_min_after == 0.0 else float(s_new[0]) / sigma_min_after
     return F_rec, cond_before, cond_after, s.copy(), s_new
+
+def open_image_array(path):
+    # 2-D grayscale array for a large input without a float copy. Only .npy
+    # files are out-of-core (memory-mapped); images are decoded whole as 8-bit
+    # grayscale, one byte per pixel, within Pillow's Image.MAX_IMAGE_PIXELS.
+    if str(path).lower().endswith(".npy"):
+        arr = np.load(path, mmap_mode="r")
+        return arr if arr.ndim == 2 else None
+    try:
+        img = Image.open(path)
+    except Image.DecompressionBombError as e:
+        raise ValueError(f"{path}: {e} Convert it to a 2-D uint8 .npy to map it out-of-core, "
+                         "or raise PIL.Image.MAX_IMAGE_PIXELS yourself.") from e
+    return np.asarray(img.convert("L"))
+
+def iter_symmetry_map_bands(img, patch_size=3, band=256, tile=1024, dtype=None):
+    # Yields (row, scores) for consecutive bands of at most band output rows of
+    # symmetry_map(img, patch_size), top to bottom, so callers can show or
+    # store the map while the rest is computed. Each band is scored in column
+    # tiles of width tile; every input block carries a halo of patch_size - 1
+    # rows/columns, so every patch is scored from exactly the pixels (and
+    # arithmetic) of the whole-image path and bands join without seams. img can
+    # be any 2-D array-like that supports slicing (uint8 image, np.memmap, ...):
+    # only one block at a time is converted to float.
+    p = int(patch_size)
+    dtype = resolve_dtype(dtype)
+    if img is None or img.ndim != 2:
+        return
+    H, W = img.shape
+    if p < 1 or H < p or W < p:
+        return
+    out_h, out_w = H - p + 1, W - p + 1
+    for i in range(0, out_h, band):
+        th = min(band, out_h - i)
+        scores = np.empty((th, out_w), dtype=dtype)
+        for j in range(0, out_w, tile):
+            tw = min(tile, out_w - j)
+            block = np.asarray(img[i:i + th + p - 1, j:j + tw + p - 1], dtype=dtype)
+            scores[:, j:j + tw] = symmetry_map(block, p, dtype=dtype)
+        yield i, scores
+
+def tiled_symmetry_map(img, patch_size=3, tile=1024, out_path=None, dtype=None):
+    # Same result as symmetry_map(img, patch_size), computed tile by tile
+    # (iter_symmetry_map_bands with tile-high bands). With out_path the map is
+    # written to a .npy file through a memory map, so peak memory is bounded by
+    # the tile size.
+    p = int(patch_size)
+    dtype = resolve_dtype(dtype)
+    if img is None or img.ndim != 2:
+        return None
+    H, W = img.shape
+    if p < 1 or H < p or W < p:
+        return None
+    out_h, out_w = H - p + 1, W - p + 1
+    if out_path is None:
+        out = np.empty((out_h, out_w), dtype=dtype)
+    else:
+        out = npformat.open_memmap(out_path, mode="w+", dtype=dtype, shape=(out_h, out_w))
+    for i, scores in iter_symmetry_map_bands(img, p, band=tile, tile=tile, dtype=dtype):
+        out[i:i + scores.shape[0]] = scores
+    if out_path is not None:
+        out.flush()
+    return out
+
+def batch_condition_numbers(mats, chunk_size=65536, dtype=None):
+    # 2-norm condition number of every matrix in an (N, n, n) stack, using
+    # stacked singular values (inf for singular matrices).
+    dtype = resolve_dtype(dtype)
+    mats = np.asarray(mats, dtype=dtype)
+    if mats.ndim == 2:
+        mats = mats[None]
+    N = mats.shape[0]
+    conds = np.empty(N, dtype=dtype)
+    for start in range(0, N, chunk_size):
+        s = np.linalg.svd(mats[start:start + chunk_size], compute_uv=False)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            c = s[:, 0] / s[:, -1]
+        conds[start:start + s.shape[0]] = np.where(s[:, -1] == 0.0, np.inf, c)
+    return conds
+
+def _recondition_block(F, C):
+    U, s, Vh = np.linalg.svd(F, full_matrices=False)
+    sigma_max = s[:, 0]
+    sigma_min = s[:, -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cond_before = np.where(sigma_min == 0.0, np.inf, sigma_max / sigma_min)
+    todo = ~((cond_before <= C) | (sigma_max == 0.0))
+
+    F_rec = F.copy()
+    s_new = s.copy()
+    cond_after = cond_before.copy()
+    if not todo.any():
+        return F_rec, cond_before, cond_after, s, s_new
+
+    # Same floor-and-smoothing rule as recondition_kernel, one column at a time:
+    # values below sigma_max / C are raised to the floor, then each floored
+    # value is averaged with its (already smoothed) predecessor.
+    st = s[todo]
+    floor_val = st[:, 0] / C
+    below = st < floor_val[:, None]
+    sn = np.where(below, floor_val[:, None], st)
+    for i in range(1, sn.shape[1]):
+        sn[:, i] = np.where(below[:, i], 0.5 * (sn[:, i - 1] + sn[:, i]), sn[:, i])
+
+    F_rec[todo] = (U[todo] * sn[:, None, :]) @ Vh[todo]
+    s_new[todo] = sn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cond_after[todo] = np.where(sn[:, -1] == 0.0, np.inf, sn[:, 0] / sn[:, -1])
+    return F_rec, cond_before, cond_after, s, s_new
+
+def batch_recondition_kernels(mats, C, chunk_size=65536, dtype=None):
+    # Vectorized recondition_kernel over an (N, n, n) stack. Returns the stacked
+    # equivalents of its outputs: (F_rec, cond_before, cond_after, s_before, s_after).
+    C = max(float(C), 1.0)
+    dtype = resolve_dtype(dtype)
+    mats = np.asarray(mats, dtype=dtype)
+    if mats.ndim == 2:
+        mats = mats[None]
+    N, n = mats.shape[0], mats.shape[-1]
+    F_rec = np.empty_like(mats)
+    cond_before = np.empty(N, dtype=dtype)
+    cond_after = np.empty(N, dtype=dtype)
+    s_before = np.empty((N, n), dtype=dtype)
+    s_after = np.empty((N, n), dtype=dtype)
+    for start in range(0, N, chunk_size):
+        sl = slice(start, min(start + chunk_size, N))
+        F_rec[sl], cond_before[sl], cond_after[sl], s_before[sl], s_after[sl] = \
+            _recondition_block(mats[sl], C)
+    return F_rec, cond_before, cond_after, s_before, s_after
+
+def recondition_h5_layers(path, C, layers=None, sizes=(3,5,7,9,11), chunk_size=65536, dtype=None,
+                          layout="HWIO"):
+    # Reconditions the kernels of conv layers of a Keras .h5 file in place:
+    # only the kernel datasets of the selected layers (all square kernels with
+    # a size in sizes when layers is None) are rewritten, in slabs of input
+    # channels, with recondition_kernel semantics and the dataset's own dtype.
+    # Kernels already at or below C keep their exact stored values.
+    C = max(float(C), 1.0)
+    report = []
+    with h5py.File(path, "r+") as f:
+        root = h5_weights_root(f)
+        names = [name for name, _ in h5_layers(root)]
+        for layer_name in (names if layers is None else layers):
+            ds = h5_kernel_dataset(root, layer_name)
+            if ds is None or len(ds.shape) != 4:
+                if layers is not None:
+                    raise ValueError(f"layer {layer_name} has no 4-D conv kernel")
+                continue
+            lay = resolve_layout(ds.shape, layout)
+            h, w, in_ch, out_ch = kernel_dims(ds.shape, lay)
+            if h != w or (layers is None and h not in sizes):
+                if layers is not None:
+                    raise ValueError(f"layer {layer_name} has a non-square {h}x{w} kernel")
+                continue
+
+            step = max(1, chunk_size // out_ch)
+            changed = 0
+            cond_max_before = cond_max_after = 0.0
+            for i0 in range(0, in_ch, step):
+                sel = np.s_[:, :, i0:i0 + step, :] if lay == "HWIO" else np.s_[:, i0:i0 + step, :, :]
+                slab = ds[sel]
+                mats, _, _ = kernels_to_matrices(slab, lay)
+                rec, before, after, s_before, _ = batch_recondition_kernels(mats, C, dtype=dtype)
+                # All-zero kernels (cond = inf) come back unchanged; a slab of
+                # only those, or of kernels already within C, is not rewritten.
+                mask = (before > C) & (s_before[:, 0] > 0)
+                n_changed = int(np.count_nonzero(mask))
+                cond_max_before = max(cond_max_before, float(before.max()))
+                cond_max_after = max(cond_max_after, float(after.max()))
+                if n_changed:
+                    rec = np.where(mask[:, None, None], rec, mats)
+                    ds[sel] = matrices_to_kernel(rec, slab.shape, lay).astype(ds.dtype)
+                    changed += n_changed
+            report.append({"layer_name": layer_name, "kernel_size": h, "num_matrices": in_ch * out_ch,
+                           "num_reconditioned": changed, "cond_max_before": cond_max_before,
+                           "cond_max_after": cond_max_after})
+    return pd.DataFrame(report)
+
+def _quantiles(values, qs):
+    # np.quantile's linear interpolation on the sorted values, except that an
+    # infinite neighbour yields inf rather than NaN (dead all-zero kernels
+    # have cond = inf).
+    v = np.sort(np.asarray(values, dtype=np.float64).ravel())
+    pos = np.asarray(qs, dtype=np.float64) * (v.size - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, v.size - 1)
+    frac = pos - lo
+    with np.errstate(invalid="ignore"):
+        lerp = v[lo] + frac * (v[hi] - v[lo])
+    return np.where((frac == 0) | (v[hi] == v[lo]), v[lo], lerp)
+
+def summarize_scores(scores, conds, mean_mat, C):
+    # Summary of one kernel population from its per-kernel symmetry scores and
+    # condition numbers and its mean kernel.
+    finite = conds[np.isfinite(conds)]
+    c_q = _quantiles(conds, [0.5, 0.9])
+    s_q = np.quantile(scores, [0.1, 0.5, 0.9])
+    return {
+        "num_matrices": int(scores.size),
+        "symmetry_mean": float(scores.mean()),
+        "symmetry_std": float(scores.std()),
+        "symmetry_p10": float(s_q[0]),
+        "symmetry_median": float(s_q[1]),
+        "symmetry_p90": float(s_q[2]),
+        "cond_mean": float(finite.mean()) if finite.size else np.inf,
+        "cond_median": float(c_q[0]),
+        "cond_p90": float(c_q[1]),
+        "cond_max": float(conds.max()),
+        "frac_cond_above_C": float(np.mean(conds > C)),
+        "mean_kernel_symmetry": compute_symmetry_score(mean_mat),
+        "mean_kernel_cond": float(batch_condition_numbers(mean_mat)[0]),
+    }
+
+def kernel_stats(mats, C, scores=None, conds=None, dtype=None):
+    if scores is None:
+        scores = batch_symmetry_scores(mats, dtype=dtype)
+    if conds is None:
+        conds = batch_condition_numbers(mats, dtype=dtype)
+    return summarize_scores(scores, conds, mats.mean(axis=0, dtype=np.float64), C)
+
+def model_census(src, C, sizes=(3,5,7,9,11), dtype=None, name=None, layout=None, progress=None):
+    # One pass over every square conv kernel of a model (any format
+    # weight_sources reads; name is the upload's file name) with a size in
+    # sizes: one row per layer, then one model-wide row per kernel size.
+    # progress(layer_name) is called after each layer.
+    rows = []
+    pooled = {}
+    with open_weight_source(src, name=name, layout=layout) as source:
+        for idx, layer_name, mats, h in iter_conv_kernels(source, sizes):
+            mats = np.asarray(mats, dtype=resolve_dtype(dtype))
+            scores = batch_symmetry_scores(mats, dtype=mats.dtype)
+            conds = batch_condition_numbers(mats, dtype=mats.dtype)
+            layer_sum = mats.sum(axis=0, dtype=np.float64)
+            rows.append({"scope": "layer", "index": idx, "layer_name": layer_name, "kernel_size": h,
+                         **summarize_scores(scores, conds, layer_sum / mats.shape[0], C)})
+            acc = pooled.setdefault(h, {"sum": np.zeros((h, h)), "scores": [], "conds": [], "layers": 0})
+            acc["sum"] += layer_sum
+            acc["scores"].append(scores)
+            acc["conds"].append(conds)
+            acc["layers"] += 1
+            if progress is not None:
+                progress(layer_name)
+    for h in sorted(pooled):
+        acc = pooled[h]
+        scores = np.concatenate(acc["scores"])
+        conds = np.concatenate(acc["conds"])
+        stats = summarize_scores(scores, conds, acc["sum"] / scores.size, C)
+        rows.append({"scope": "model", "index": None, "layer_name": f"all {acc['layers']} layers",
+                     "kernel_size": h, **stats})
+    return pd.DataFrame(rows)
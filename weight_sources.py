@@ -0,0 +1,560 @@
+import json
+import os
+import pickle
+import posixpath
+import zipfile
+from collections import OrderedDict
+from io import BytesIO
+
+import h5py
+import numpy as np
+import pandas as pd
+from numpy.lib import format as npformat
+
+
+# Pluggable readers for the weights of a trained model. Every source lists its
+# layers with the shape of their first weight (the kernel) from metadata only,
+# reads one layer's kernel at a time on demand, and declares the layout of its
+# conv kernels, so nothing has to guess HWIO versus OIHW from the shape:
+#
+#   with open_weight_source("model.pt") as src:
+#       for idx, name, mats, n in iter_conv_kernels(src, sizes=(3, 5)):
+#           ...
+#
+# .h5, .keras, .npz and PyTorch state_dict files are parsed directly (no
+# TensorFlow or torch import). ONNX and SavedModel need the onnx / tensorflow
+# packages and import them only when such a file is opened. This module
+# depends on no other module of the app; utils builds on it.
+
+
+# Conv kernel tensor layouts: Keras/TF store (h, w, in, out), PyTorch and ONNX
+# (out, in, h, w). The permutation to (in, out, h, w) is its own inverse.
+LAYOUTS = ("HWIO", "OIHW")
+_LAYOUT_PERM = {"HWIO": (2, 3, 0, 1), "OIHW": (1, 0, 2, 3)}
+
+
+def resolve_layout(shape, layout):
+    # Without an explicit layout, HWIO is guessed when both leading dims are <= 11.
+    if layout is None:
+        return "HWIO" if shape[0] <= 11 and shape[1] <= 11 else "OIHW"
+    if layout not in _LAYOUT_PERM:
+        raise ValueError(f"unknown kernel layout: {layout}")
+    return layout
+
+
+def kernel_dims(shape, layout=None):
+    # (h, w, in_channels, out_channels) of a 4-D conv kernel shape.
+    if resolve_layout(shape, layout) == "HWIO":
+        h, w, in_ch, out_ch = shape
+    else:
+        out_ch, in_ch, h, w = shape
+    return int(h), int(w), int(in_ch), int(out_ch)
+
+
+def kernels_to_matrices(K, layout=None):
+    if K.ndim != 4:
+        return None, None, None
+    h, w, _, _ = kernel_dims(K.shape, layout)
+    mats = np.transpose(K, _LAYOUT_PERM[resolve_layout(K.shape, layout)])
+    mats = mats.reshape(-1, h, w)
+    return mats, h, w
+
+
+def matrices_to_kernel(mats, shape, layout=None):
+    # Inverse of kernels_to_matrices for a kernel tensor of the given shape:
+    # matrix in_channel * out_channels + out_channel goes back to its slot.
+    h, w, in_ch, out_ch = kernel_dims(shape, layout)
+    return np.transpose(mats.reshape(in_ch, out_ch, h, w), _LAYOUT_PERM[resolve_layout(shape, layout)])
+
+
+# Keras HDF5 files, read through h5py metadata (no TensorFlow); also used by
+# utils.recondition_h5_layers.
+def open_h5(src):
+    if isinstance(src, (str, os.PathLike)):
+        return h5py.File(src, "r")
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return h5py.File(BytesIO(src), "r")
+    src.seek(0)
+    return h5py.File(src, "r")
+
+
+def _h5_str(v):
+    return v.decode("utf-8") if isinstance(v, bytes) else str(v)
+
+
+def h5_weights_root(f):
+    # Full-model saves keep weights under /model_weights; save_weights files
+    # carry the layer_names attribute on the root group.
+    root = f["model_weights"] if "model_weights" in f else f
+    if "layer_names" not in root.attrs:
+        raise ValueError("no Keras layer metadata in HDF5 file")
+    return root
+
+
+def h5_kernel_dataset(root, layer_name):
+    # The dataset of a layer's first weight (its kernel), or None.
+    g = root[layer_name]
+    weight_names = [_h5_str(w) for w in g.attrs.get("weight_names", [])]
+    return g[weight_names[0]] if weight_names else None
+
+
+def h5_layers(root):
+    # [(layer_name, kernel shape or None)] of an open Keras weights root.
+    layers = []
+    for name in (_h5_str(n) for n in root.attrs["layer_names"]):
+        ds = h5_kernel_dataset(root, name)
+        layers.append((name, tuple(int(d) for d in ds.shape) if ds is not None else None))
+    return layers
+
+
+def list_h5_layers(src):
+    # [(layer_name, shape of the layer's first weight or None)] in model.layers
+    # order, read from HDF5 metadata only; no weight data and no TensorFlow.
+    with open_h5(src) as f:
+        return h5_layers(h5_weights_root(f))
+
+
+def read_h5_kernel(src, layer_name):
+    # The first weight tensor (the kernel) of one layer, or None if it has none.
+    with open_h5(src) as f:
+        ds = h5_kernel_dataset(h5_weights_root(f), layer_name)
+        return ds[()] if ds is not None else None
+
+
+SOURCES = []
+
+
+def register_source(cls):
+    SOURCES.append(cls)
+    return cls
+
+
+def _as_file(src):
+    if isinstance(src, (str, os.PathLike)):
+        return open(src, "rb")
+    if isinstance(src, (bytes, bytearray, memoryview)):
+        return BytesIO(src)
+    src.seek(0)
+    return src
+
+
+class WeightSource:
+    # Subclasses set FORMAT, EXTS and LAYOUT and implement sniff(f) (is the
+    # open file in this format?), layers() and read(). layers() is
+    # [(layer name, kernel shape or None)] in model order; read(name) returns
+    # that kernel as an ndarray, or None. Constructors raise ValueError for
+    # input they cannot read (corrupt or unsupported files, missing optional
+    # packages), so callers need to handle only OSError and ValueError.
+    FORMAT = None
+    EXTS = ()
+    LAYOUT = "HWIO"
+
+    def __init__(self, src, layout=None):
+        self.src = src
+        self.layout = layout or self.LAYOUT
+
+    @classmethod
+    def sniff(cls, f):
+        return False
+
+    def layers(self):
+        raise NotImplementedError
+
+    def read(self, name):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@register_source
+class H5Source(WeightSource):
+    # Keras HDF5 (full model or save_weights): the first weight of each layer.
+    FORMAT = "h5"
+    EXTS = (".h5", ".hdf5")
+
+    @classmethod
+    def sniff(cls, f):
+        return f.read(8) == b"\x89HDF\r\n\x1a\n"
+
+    def __init__(self, src, layout=None):
+        super().__init__(src, layout)
+        self._f = open_h5(src)
+        try:
+            self._root = h5_weights_root(self._f)
+        except BaseException:
+            self._f.close()
+            raise
+
+    def layers(self):
+        return h5_layers(self._root)
+
+    def read(self, name):
+        ds = h5_kernel_dataset(self._root, name)
+        return ds[()] if ds is not None else None
+
+    def close(self):
+        self._f.close()
+
+
+def _zip_names(f):
+    try:
+        with zipfile.ZipFile(f) as zf:
+            return zf.namelist()
+    except zipfile.BadZipFile:
+        return []
+
+
+class _ZipSource(WeightSource):
+    def __init__(self, src, layout=None):
+        super().__init__(src, layout)
+        self._file = _as_file(src)
+        try:
+            self._zip = zipfile.ZipFile(self._file)
+        except zipfile.BadZipFile as e:
+            self._close_file()
+            raise ValueError(f"not a valid {self.FORMAT} file: {e}") from e
+
+    def _close_file(self):
+        if self._file is not self.src:
+            self._file.close()
+
+    def close(self):
+        self._zip.close()
+        self._close_file()
+
+
+@register_source
+class KerasZipSource(_ZipSource):
+    # Keras v3 .keras archive: config.json plus model.weights.h5, where each
+    # layer's variables are datasets 0, 1, ... of a <path>/vars group.
+    FORMAT = "keras"
+    EXTS = (".keras",)
+
+    @classmethod
+    def sniff(cls, f):
+        names = _zip_names(f)
+        return "config.json" in names and "model.weights.h5" in names
+
+    def __init__(self, src, layout=None):
+        super().__init__(src, layout)
+        self._f = None
+        try:
+            self._index()
+        except (KeyError, OSError, ValueError) as e:
+            self.close()
+            raise ValueError(f"corrupt .keras archive: {e}") from e
+
+    def _index(self):
+        # h5py needs a seekable file; an uncompressed member is read straight
+        # from the archive, a deflated one is inflated into memory.
+        info = self._zip.getinfo("model.weights.h5")
+        member = self._zip.open(info)
+        self._weights = member if info.compress_type == zipfile.ZIP_STORED else BytesIO(member.read())
+        self._f = h5py.File(self._weights, "r")
+        self._vars = {}
+        def visit(path, obj):
+            if isinstance(obj, h5py.Group) and path.endswith("/vars"):
+                skip = ("layers", "_layer_checkpoint_dependencies")
+                parts = [p for p in path.split("/")[:-1] if p not in skip]
+                if parts and "0" in obj:
+                    self._vars["/".join(parts)] = obj
+        # Only the layers/ group holds model weights; optimizer/ holds slot
+        # variables with the same vars/ layout.
+        if "layers" in self._f:
+            self._f["layers"].visititems(visit)
+
+        # h5 groups are listed alphabetically; config.json has the model order.
+        order = []
+        def walk(cfg):
+            inner = cfg.get("config")
+            if isinstance(inner, dict):
+                for layer in inner.get("layers", []):
+                    order.append(layer.get("config", {}).get("name"))
+                    walk(layer)
+        walk(json.loads(self._zip.read("config.json")))
+        rank = {name: i for i, name in enumerate(order)}
+        self._names = sorted(self._vars, key=lambda p: (rank.get(p.split("/")[-1], len(rank)), p))
+
+    def layers(self):
+        return [(name, tuple(int(d) for d in self._vars[name]["0"].shape)) for name in self._names]
+
+    def read(self, name):
+        return self._vars[name]["0"][()]
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+        super().close()
+
+
+@register_source
+class NpzSource(_ZipSource):
+    # One array per key; conv kernels are the 4-D arrays, in the layout given
+    # at open time (HWIO unless told otherwise).
+    FORMAT = "npz"
+    EXTS = (".npz",)
+
+    @classmethod
+    def sniff(cls, f):
+        names = _zip_names(f)
+        return bool(names) and all(n.endswith(".npy") for n in names)
+
+    def layers(self):
+        layers = []
+        for info in self._zip.infolist():
+            with self._zip.open(info) as f:
+                version = npformat.read_magic(f)
+                read_header = npformat.read_array_header_1_0 if version == (1, 0) else npformat.read_array_header_2_0
+                shape, _, _ = read_header(f)
+            layers.append((info.filename[:-4], tuple(int(d) for d in shape)))
+        return layers
+
+    def read(self, name):
+        with self._zip.open(name + ".npy") as f:
+            return npformat.read_array(f)
+
+
+_TORCH_DTYPES = {
+    "FloatStorage": np.float32, "DoubleStorage": np.float64, "HalfStorage": np.float16,
+    "BFloat16Storage": "bfloat16", "LongStorage": np.int64, "IntStorage": np.int32,
+    "ShortStorage": np.int16, "CharStorage": np.int8, "ByteStorage": np.uint8, "BoolStorage": np.bool_,
+}
+
+
+class _TorchTensor:
+    # A tensor of a torch zip checkpoint, resolved to data only on read.
+    def __init__(self, storage, offset, size, stride):
+        self.storage, self.offset, self.shape, self.stride = storage, offset, tuple(size), tuple(stride)
+
+
+class _TorchUnpickler(pickle.Unpickler):
+    # Resolves only the handful of globals a state_dict pickle uses, so no
+    # torch import is needed and no other code can run while loading.
+    def find_class(self, module, name):
+        if (module, name) == ("collections", "OrderedDict"):
+            return OrderedDict
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return lambda storage, offset, size, stride, *rest: _TorchTensor(storage, offset, size, stride)
+        if module == "torch._utils" and name in ("_rebuild_parameter", "_rebuild_parameter_with_state"):
+            return lambda data, *rest: data
+        if module == "torch" and name in _TORCH_DTYPES:
+            return _TORCH_DTYPES[name]
+        raise pickle.UnpicklingError(f"unsupported global in checkpoint: {module}.{name}")
+
+    def persistent_load(self, pid):
+        # ("storage", dtype, key, location, numel)
+        return pid[1], pid[2]
+
+
+@register_source
+class TorchSource(_ZipSource):
+    # PyTorch zip checkpoint (torch.save of a state_dict, or a dict holding one
+    # under "state_dict" / "model_state_dict" / "model"). Layers are the module
+    # prefixes of the keys, their kernel the ".weight" tensor, layout OIHW.
+    FORMAT = "torch"
+    EXTS = (".pt", ".pth", ".bin", ".ckpt")
+    LAYOUT = "OIHW"
+
+    @classmethod
+    def sniff(cls, f):
+        return any(n.endswith("/data.pkl") for n in _zip_names(f))
+
+    def __init__(self, src, layout=None):
+        try:
+            super().__init__(src, layout)
+        except ValueError as e:
+            raise ValueError("not a zip PyTorch checkpoint; legacy (pre-1.6) torch.save files are not "
+                             "supported, re-save with a current torch") from e
+        try:
+            pkl = next(n for n in self._zip.namelist() if n.endswith("/data.pkl"))
+            self._prefix = pkl[:-len("data.pkl")]
+            obj = _TorchUnpickler(BytesIO(self._zip.read(pkl))).load()
+        except (StopIteration, pickle.UnpicklingError, EOFError, KeyError, TypeError) as e:
+            self.close()
+            raise ValueError(f"only state_dict PyTorch checkpoints are supported, not whole pickled "
+                             f"modules ({e})") from e
+        for key in ("state_dict", "model_state_dict", "model"):
+            if isinstance(obj, dict) and isinstance(obj.get(key), dict):
+                obj = obj[key]
+                break
+        if not isinstance(obj, dict):
+            self.close()
+            raise ValueError(f"PyTorch checkpoint holds a {type(obj).__name__}, not a state_dict")
+        self._tensors = {k: v for k, v in obj.items() if isinstance(v, _TorchTensor)}
+        self._modules = list(OrderedDict.fromkeys(k.rsplit(".", 1)[0] for k in self._tensors))
+
+    def layers(self):
+        return [(m, self._tensors[m + ".weight"].shape if m + ".weight" in self._tensors else None)
+                for m in self._modules]
+
+    def read(self, name):
+        t = self._tensors.get(name + ".weight")
+        if t is None:
+            return None
+        dtype, key = t.storage
+        raw = self._zip.read(f"{self._prefix}data/{key}")
+        if dtype == "bfloat16":
+            data = (np.frombuffer(raw, dtype="<u2").astype(np.uint32) << 16).view(np.float32)
+        else:
+            data = np.frombuffer(raw, dtype=np.dtype(dtype).newbyteorder("<"))
+        item = data.itemsize
+        return np.lib.stride_tricks.as_strided(
+            data[t.offset:], shape=t.shape, strides=tuple(s * item for s in t.stride)).copy()
+
+
+@register_source
+class OnnxSource(WeightSource):
+    # ONNX graph (needs the onnx package): the weight input of every Conv node.
+    FORMAT = "onnx"
+    EXTS = (".onnx",)
+    LAYOUT = "OIHW"
+
+    def __init__(self, src, layout=None):
+        super().__init__(src, layout)
+        try:
+            import onnx
+            from onnx import numpy_helper
+        except ImportError as e:
+            raise ValueError("reading .onnx models needs the onnx package (pip install onnx)") from e
+        f = _as_file(src)
+        try:
+            model = onnx.load_model(f)
+        except Exception as e:
+            raise ValueError(f"not a readable ONNX model: {e}") from e
+        finally:
+            if f is not src:
+                f.close()
+        self._to_array = numpy_helper.to_array
+        inits = {t.name: t for t in model.graph.initializer}
+        self._weights = OrderedDict()
+        for i, node in enumerate(model.graph.node):
+            if node.op_type == "Conv" and len(node.input) > 1 and node.input[1] in inits:
+                self._weights[node.name or f"conv_{i}"] = inits[node.input[1]]
+
+    def layers(self):
+        return [(name, tuple(int(d) for d in t.dims)) for name, t in self._weights.items()]
+
+    def read(self, name):
+        return self._to_array(self._weights[name])
+
+
+@register_source
+class SavedModelSource(WeightSource):
+    # TensorFlow SavedModel directory (needs tensorflow): variables read from
+    # its checkpoint one at a time, without restoring the model.
+    FORMAT = "savedmodel"
+    SUFFIX = "/.ATTRIBUTES/VARIABLE_VALUE"
+
+    def __init__(self, src, layout=None):
+        super().__init__(src, layout)
+        try:
+            import tensorflow as tf
+        except ImportError as e:
+            raise ValueError("reading SavedModel directories needs tensorflow") from e
+        try:
+            self._reader = tf.train.load_checkpoint(os.path.join(src, "variables", "variables"))
+        except (tf.errors.OpError, ValueError) as e:
+            raise ValueError(f"cannot read the SavedModel's variables: {e}") from e
+        shapes = self._reader.get_variable_to_shape_map()
+        self._kernels = OrderedDict(
+            (k[:-len(self.SUFFIX)].rsplit("/", 1)[0], k) for k in sorted(shapes)
+            if k.endswith("/kernel" + self.SUFFIX))
+        self._shapes = shapes
+
+    def layers(self):
+        return [(name, tuple(int(d) for d in self._shapes[k])) for name, k in self._kernels.items()]
+
+    def read(self, name):
+        return self._reader.get_tensor(self._kernels[name])
+
+
+MODEL_EXTS = tuple(e for cls in SOURCES for e in cls.EXTS)
+
+
+def open_weight_source(src, name=None, layout=None, format=None):
+    # src: a path, a SavedModel directory, bytes or a file-like upload. The
+    # format is sniffed from the content; name (the upload's file name) decides
+    # by extension for formats without a signature (ONNX).
+    if format is not None:
+        cls = next((c for c in SOURCES if c.FORMAT == format), None)
+        if cls is None:
+            raise ValueError(f"unknown weight source format: {format}")
+        return cls(src, layout)
+    if isinstance(src, (str, os.PathLike)):
+        if os.path.isdir(src):
+            if os.path.exists(os.path.join(src, "saved_model.pb")):
+                return SavedModelSource(src, layout)
+            raise ValueError(f"{src} is not a SavedModel directory")
+        name = name or os.fspath(src)
+    f = _as_file(src)
+    try:
+        found = None
+        for cls in SOURCES:
+            f.seek(0)
+            if cls.sniff(f):
+                found = cls
+                break
+    finally:
+        if f is src:
+            f.seek(0)
+        else:
+            f.close()
+    if found is None:
+        ext = posixpath.splitext(str(name or "").lower())[1]
+        found = next((cls for cls in SOURCES if ext in cls.EXTS), None)
+        if found is None:
+            raise ValueError("unrecognized model file format")
+    return found(src, layout)
+
+
+def layer_table(source, sizes):
+    # One row per layer (page 01 / cli.py layers.csv), with the status
+    # "matched", "ignored_size" or "no_matrices".
+    records = []
+    for idx, (layer_name, shape) in enumerate(source.layers()):
+        if shape is not None and len(shape) == 4:
+            h, w, in_ch, out_ch = kernel_dims(shape, source.layout)
+            status = "matched" if (h == w and h in sizes and h not in (1,2)) else "ignored_size"
+            records.append({
+                "index": idx, "layer_name": layer_name,
+                "kernel_h": h, "kernel_w": w,
+                "in_channels": in_ch, "out_channels": out_ch,
+                "num_matrices": in_ch * out_ch, "status": status,
+            })
+        else:
+            records.append({
+                "index": idx, "layer_name": layer_name,
+                "kernel_h": None, "kernel_w": None,
+                "in_channels": None, "out_channels": None,
+                "num_matrices": 0, "status": "no_matrices",
+            })
+    return pd.DataFrame(records, columns=["index", "layer_name", "kernel_h", "kernel_w", "in_channels",
+                                          "out_channels", "num_matrices", "status"])
+
+
+def read_matrices(source, name):
+    # (mats, h, w) of one layer's kernel in the source's layout, or (None, None, None).
+    kernel = source.read(name)
+    if kernel is None:
+        return None, None, None
+    return kernels_to_matrices(kernel, source.layout)
+
+
+def iter_conv_kernels(source, sizes=(3,5,7,9,11)):
+    # Lazily yields (layer index, layer name, (N, n, n) matrices, n) for every
+    # square conv kernel with a size in sizes, one layer in memory at a time.
+    for idx, (name, shape) in enumerate(source.layers()):
+        if shape is None or len(shape) != 4:
+            continue
+        h, w, _, _ = kernel_dims(shape, source.layout)
+        if h != w or h not in sizes:
+            continue
+        mats, n, _ = read_matrices(source, name)
+        yield idx, name, mats, n